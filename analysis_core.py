@@ -0,0 +1,658 @@
+'''
+Analysis core shared by plot_by_attr.py, plot_by_attr_non_uniform.py and plot_by_attr_threshold.py.
+
+An AnalysisSession is one loaded dataset. It loads the CSV once, through the columnar cache or its
+memory-mapped copy, or streams it in chunks, and keeps the row index of each column grouped by, the
+result cache, the profiler and the renderer plots go to. Columns not loaded up front are loaded the first
+time an analysis uses them, so the shells only ever hold the columns their commands use. Every analysis
+of the three scripts is built from the same few aggregations it runs:
+    trait_counts         people per trait, for trait_breakdown and the traits of ALL
+    error_stats          histogram of errors per trait, for linear and RMS correct_for, bootstrap and bias_gap_test
+    trait_decile_counts  people per (trait, decile) cell split by recidivism, for non-uniform correct_for
+    trait_curves         false positives and negatives per trait and threshold, for the threshold sweeps
+    outcome_histograms   people per trait and score split by each outcome column, for the error models
+and every correction comes from the ErrorStats of bias_stats.py.
+
+BaseAnalyzer and BaseShell are what the scripts' DataAnalyzer and AnalyzerShell have in common. An
+analyzer given the session of another shares its dataset rather than loading it again, so one load
+serves linear, RMS, non-uniform and threshold analyses alike, i.e. in the shell of plot_by_attr_all.py.
+'''
+import os
+import cmd
+import threading
+import numpy as np
+import matplotlib.pyplot as plt
+import pandas as pd
+
+from dataset import load_dataset, TraitRowIndex
+from mmap_dataset import load_mmap_dataset
+from plot_renderer import DEFAULT_FORMATS, FigureRenderer
+from csv_stream import DEFAULT_CHUNKSIZE, read_csv_chunks, value_counts_chunked
+from bias_stats import ErrorStats
+from result_cache import ResultCache
+from profiler import Profiler
+
+
+class CSVReaderConst(object):
+    HIGHEST_RISK = 10
+    LOWEST_RISK = 1
+    THRESHOLD_RISK = 4
+    RACES_TO_CORRECT = ["African American", "White"]
+    RECIDIVISM_COL_NAME = "two_year_recid"
+
+
+def score_histograms(group_codes, num_groups, scores, recid):
+    '''
+    Builds one histogram of score vs. actual recidivism per group, over the distinct score values.
+    Rows with a group code of -1 or a missing score are left out.
+    '''
+    keep = (group_codes >= 0) & ~np.isnan(scores)
+    score_codes, score_values = pd.factorize(scores[keep], sort=True)
+    cell_codes = group_codes[keep] * len(score_values) + score_codes
+    num_cells = num_groups * len(score_values)
+    shape = (num_groups, len(score_values))
+    is_recid = recid[keep]
+    recid_hist = np.bincount(cell_codes[is_recid], minlength=num_cells).reshape(shape)
+    non_recid_hist = np.bincount(cell_codes[~is_recid], minlength=num_cells).reshape(shape)
+    return np.asarray(score_values), recid_hist, non_recid_hist
+
+
+def sweep_thresholds(score_values, recid_hist, non_recid_hist, thresholds):
+    '''
+    Gets false negatives (recidivism at score <= threshold) and false positives (no recidivism at
+    score > threshold) for every group and threshold from cumulative sums of the score histograms
+    '''
+    # number of distinct scores at or below each threshold, so 0 means no score is <= threshold
+    below = np.searchsorted(score_values, np.asarray(thresholds, dtype=float), side="right")
+    zeros = np.zeros((recid_hist.shape[0], 1), dtype=recid_hist.dtype)
+    recid_at_or_below = np.hstack([zeros, np.cumsum(recid_hist, axis=1)])
+    non_recid_at_or_below = np.hstack([zeros, np.cumsum(non_recid_hist, axis=1)])
+    false_neg = recid_at_or_below[:, below]
+    false_pos = non_recid_at_or_below[:, -1:] - non_recid_at_or_below[:, below]
+    return false_pos, false_neg
+
+
+def cell_error_stats(score_values, recid_counts, non_recid_counts, groups=None,
+                     targets=(CSVReaderConst.HIGHEST_RISK, CSVReaderConst.LOWEST_RISK)):
+    '''
+    ErrorStats from the number of people at each score with and without recidivism, counts of shape
+    (..., n_scores), i.e. (traits, deciles) or (windows, traits, scores). Every row of the counts is one of
+    groups, whose errors are those of all its scores. Without groups, every (row, score) cell is a group
+    of its own, numbered row * n_scores + score_pos, as non-uniform correct_for corrects each decile of
+    each trait by itself. targets are the scores expected of those with and without recidivism, or
+    another outcome, that errors are measured from.
+    '''
+    # everyone with the same score has one of two errors depending on recidivism, so a group's error
+    # histogram is just the counts moved to the error of each score
+    score_values = np.asarray(score_values, dtype=float)
+    recid_counts, non_recid_counts = np.asarray(recid_counts), np.asarray(non_recid_counts)
+    # rows of every leading axis, which reshape can't infer when there are no scores
+    num_rows = int(np.prod(recid_counts.shape[:-1]))
+    recid_counts = recid_counts.reshape(num_rows, len(score_values))
+    non_recid_counts = non_recid_counts.reshape(num_rows, len(score_values))
+    recid_errors = score_values - targets[0]
+    non_recid_errors = score_values - targets[1]
+    error_values = np.union1d(recid_errors, non_recid_errors)
+    if groups is None:
+        groups = np.arange(num_rows * len(score_values))
+        counts = np.zeros((len(groups), len(error_values)), dtype=np.int64)
+        for errors, error_counts in [(recid_errors, recid_counts), (non_recid_errors, non_recid_counts)]:
+            counts[np.arange(len(groups)), np.tile(np.searchsorted(error_values, errors), num_rows)] += \
+                error_counts.ravel()
+    else:
+        counts = np.zeros((num_rows, len(error_values)), dtype=np.int64)
+        for errors, error_counts in [(recid_errors, recid_counts), (non_recid_errors, non_recid_counts)]:
+            counts[:, np.searchsorted(error_values, errors)] += error_counts
+    return ErrorStats(groups, error_values, counts)
+
+
+def _trait_index(col_name, traits):
+    if len(traits) and isinstance(traits[0], tuple):
+        # traits of several columns, which np.asarray would turn into a 2-D array
+        return pd.MultiIndex.from_tuples(list(dict.fromkeys(traits)), names=col_name.split(","))
+    return pd.Index(pd.unique(np.asarray(traits, dtype=object)))
+
+
+class AnalysisSession(object):
+    def __init__(self, filepath, columns=None, chunksize=None, profiler=None, mmap=False, df=None):
+        '''
+        Loads the CSV through the columnar cache, compacted. Give columns to only load those up front, two_year_recid is
+        always loaded, and any other column is loaded the first time an analysis uses it.
+        Give a chunksize to stream the CSV in chunks of that many rows for every analysis instead of loading it.
+        Give an enabled Profiler to time the load too, the session's own profiler starts off.
+        With mmap, the columns are mapped from their binary copy instead, shared with every other process using them.
+        Give df to analyze a frame already in memory instead, with a filepath of None if no CSV is behind it.
+        '''
+        self.filepath = filepath
+        self.chunksize = chunksize
+        self.mmap = mmap
+        self.profiler = profiler if profiler is not None else Profiler()
+        # set to a FigureRenderer to write plots to files instead of showing them
+        self.renderer = None
+        # the loaded frame and the TraitRowIndex of each column grouped by in it so far, built the first time
+        # it is needed. Both are replaced in one assignment, so a thread never sees the index of another frame
+        self._loaded = (df, {})
+        if columns is not None and CSVReaderConst.RECIDIVISM_COL_NAME not in columns:
+            columns = list(columns) + [CSVReaderConst.RECIDIVISM_COL_NAME]
+        self._columns = columns
+        # held while the loaded frame is replaced, so threads sharing the session don't load it twice or lose
+        # each other's columns
+        self._lock = threading.Lock()
+        # results of earlier analyses, dropped if the CSV changes
+        self.results = ResultCache(filepath)
+        if df is None and chunksize is None:
+            self.load()
+
+    @property
+    def df(self):
+        return self._loaded[0]
+
+    def load(self):
+        with self.profiler.stage("load") as record:
+            load = load_mmap_dataset if self.mmap else load_dataset
+            df = load(self.filepath, columns=self._columns)
+            record["rows"] = len(df)
+        self._loaded = (df, {})
+
+    def use_columns(self, columns):
+        '''
+        Loads any of columns the loaded frame doesn't have yet. Columns of the frame stay where they are,
+        so on their mapped files with mmap, and row indexes built on it stay valid.
+        '''
+        if self.df is None or self.filepath is None:
+            return
+        with self._lock:
+            df, row_index = self._loaded
+            missing = [col_name for col_name in dict.fromkeys(columns) if col_name not in df.columns]
+            if not missing:
+                return
+            with self.profiler.stage("load", rows=len(df)):
+                load = load_mmap_dataset if self.mmap else load_dataset
+                added = load(self.filepath, columns=missing)
+                data = dict((col_name, df[col_name].values) for col_name in df.columns)
+                data.update((col_name, added[col_name].values) for col_name in missing)
+                # copy=False as in load_mmap_dataset, neither the loaded nor the added columns are copied
+                self._loaded = (pd.DataFrame(data, columns=list(data), copy=False), row_index)
+                self._columns = list(data)
+
+    def require_loaded(self, analysis):
+        if self.df is None:
+            raise ValueError("{0!s} needs the CSV loaded, it can't be used when streaming".format(analysis))
+
+    def cached(self, analysis, columns, traits, mode, compute):
+        '''
+        Returns compute() for the analysis of columns from the result cache, loading the columns first if
+        they aren't yet. If the CSV changed since it was loaded, it is reloaded first and every cached result
+        dropped.
+        '''
+        if self.results.dataset_changed():
+            with self._lock:
+                # another thread may have reloaded it while this one waited
+                if self.results.dataset_changed():
+                    if self.df is not None:
+                        self.load()
+                    self.results.reset()
+        self.use_columns([col_name for column in columns for col_name in column.split(",")] +
+                         [CSVReaderConst.RECIDIVISM_COL_NAME])
+        key = (analysis, tuple(columns), None if traits is None else tuple(traits), mode)
+        return self.results.get(key, compute)
+
+    def frames(self, columns):
+        '''
+        Yields the data to aggregate over, the whole frame when loaded, or chunks of the CSV when streaming
+        '''
+        df = self.df
+        if df is not None:
+            yield df
+        else:
+            for chunk in read_csv_chunks(self.filepath, columns, self.chunksize):
+                yield chunk
+
+    def trait_rows(self, col_name, frame=None):
+        '''
+        Returns the TraitRowIndex of col_name in the loaded frame, building it on first use. col_name can
+        be several comma separated columns, i.e. race,sex,age_cat, whose traits are tuples of their values.
+        Give the frame the rows are taken from, if it was taken from the session earlier, to get the index
+        of that frame even if the CSV was reloaded since.
+        '''
+        group_columns = col_name.split(",")
+        self.use_columns(group_columns)
+        df, row_index = self._loaded
+        if frame is not None and frame is not df:
+            # a frame since replaced, i.e. by a reload on another thread, gets an index of its own
+            return self._build_trait_rows(frame, group_columns)
+        if col_name not in row_index:
+            row_index[col_name] = self._build_trait_rows(df, group_columns)
+        return row_index[col_name]
+
+    def _build_trait_rows(self, frame, group_columns):
+        column = frame[group_columns] if len(group_columns) > 1 else frame[group_columns[0]]
+        with self.profiler.stage("group_index", rows=len(column)):
+            return TraitRowIndex(column)
+
+    def plot(self, name, draw_func, *args):
+        '''
+        Draws a plot with draw_func(fig, *args). It goes on a new interactive pyplot figure, unless a
+        renderer is set, which draws it in the background and writes it to a file named after name.
+        '''
+        with self.profiler.stage("render"):
+            if self.renderer is not None:
+                self.renderer.submit(name, draw_func, *args)
+            else:
+                draw_func(plt.figure(), *args)
+                plt.draw()
+                plt.pause(0.001)
+
+    def trait_counts(self, col_name):
+        '''
+        Number of people with each trait in col_name, most common first
+        '''
+        return self.cached("trait_breakdown", [col_name], None, None, lambda: self._value_counts(col_name))
+
+    def _value_counts(self, col_name):
+        group_columns = col_name.split(",")
+        if self.df is None:
+            with self.profiler.stage("aggregate") as record:
+                counts = value_counts_chunked(self.filepath, group_columns if len(group_columns) > 1 else col_name,
+                                              self.chunksize)
+                record["rows"] = counts.sum()
+            return counts
+        if len(group_columns) > 1:
+            # only counts combinations that occur, unlike value_counts of categoricals
+            trait_rows = self.trait_rows(col_name)
+            with self.profiler.stage("aggregate", rows=len(trait_rows.codes)):
+                return trait_rows.counts()
+        df = self.df
+        with self.profiler.stage("aggregate", rows=len(df)):
+            return df[col_name].value_counts(sort=True, ascending=False)
+
+    def recid_table(self, col_name, attr, recid_dec_col_name):
+        '''
+        Table of people with attr in col_name by their score and whether recidivism actually occured
+        '''
+        self.require_loaded("plot_recid")
+        return self.cached("recid", [col_name, recid_dec_col_name], [attr], None,
+                           lambda: self._recid_table(col_name, attr, recid_dec_col_name))
+
+    def _recid_table(self, col_name, attr, recid_dec_col_name):
+        # cuts down table to only where attr exists, creates 2D table using decile, and actual recidivism occuring
+        df = self.df
+        trait_rows = self.trait_rows(col_name, df)
+        with self.profiler.stage("aggregate", rows=len(df)):
+            updated_df = df.iloc[trait_rows.rows(attr)]
+            return pd.crosstab(index=updated_df[recid_dec_col_name], columns=updated_df[CSVReaderConst.RECIDIVISM_COL_NAME])
+
+    def _chunk_rows(self, frame, col_name, trait_index):
+        '''
+        Returns the rows of everyone in frame with one of the traits, and the position of their trait. Rows
+        of the loaded frame are grouped by trait, in the order of trait_index.
+        '''
+        if frame is self.df:
+            return self.trait_rows(col_name, frame).select(trait_index)
+        group_columns = col_name.split(",")
+        if len(group_columns) > 1:
+            codes = trait_index.get_indexer(pd.MultiIndex.from_frame(frame[group_columns]))
+        else:
+            codes = trait_index.get_indexer(frame[col_name])
+        rows = np.flatnonzero(codes >= 0)
+        return rows, codes[rows]
+
+    def _chunk_errors(self, frame, col_name, recid_dec_col_name, trait_index):
+        '''
+        Returns the trait code, score and target score of everyone in frame with one of the traits
+        '''
+        rows, codes = self._chunk_rows(frame, col_name, trait_index)
+        scores = frame[recid_dec_col_name].values[rows].astype(float)
+        recid = frame[CSVReaderConst.RECIDIVISM_COL_NAME].values[rows].astype(np.int64)
+        # if recidivism occured, we should expect HIGHEST_RISK, otherwise LOWEST_RISK
+        targets = np.where(recid == 1, CSVReaderConst.HIGHEST_RISK, CSVReaderConst.LOWEST_RISK)
+        return codes, scores, targets
+
+    def error_stats(self, col_name, recid_dec_col_name, traits):
+        '''
+        Single pass engine for correct_for. Builds the histogram of errors per trait, chunk by chunk when
+        streaming, from which baseline and corrected metrics for every trait follow. Linear and RMS metrics
+        come from the same histogram, so it is cached once for both.
+        '''
+        return self.cached("error_stats", [col_name, recid_dec_col_name], traits, None,
+                           lambda: self._error_stats(col_name, recid_dec_col_name, traits))
+
+    def _error_stats(self, col_name, recid_dec_col_name, traits):
+        trait_index = _trait_index(col_name, traits)
+        if self.df is not None:
+            # built outside the aggregate stage, so it is timed on its own
+            self.trait_rows(col_name)
+        stats = ErrorStats(trait_index, [], [])
+        with self.profiler.stage("aggregate", rows=0) as record:
+            for frame in self.frames(col_name.split(",") + [recid_dec_col_name, CSVReaderConst.RECIDIVISM_COL_NAME]):
+                codes, scores, targets = self._chunk_errors(frame, col_name, recid_dec_col_name, trait_index)
+                stats = stats.merge(ErrorStats.from_errors(trait_index, codes, scores - targets))
+                record["rows"] += len(frame)
+        return stats
+
+    def trait_decile_counts(self, col_name, recid_dec_col_name, traits):
+        '''
+        Integer-coded aggregation for non-uniform correct_for. Counts people per (trait, decile) cell into
+        dense 2-D arrays of shape (n_traits, n_deciles), split by whether recidivism occured. Cells are also
+        ordered by where they first appear, trait by trait, which is the order the old row loop discovered
+        them in. When streaming, each chunk's counts are added in, so the data is only read once. The counts
+        are cached, so linear and RMS corrections share them. People with a missing score are left out.
+        '''
+        return self.cached("trait_decile_counts", [col_name, recid_dec_col_name], traits, None,
+                           lambda: self._count_trait_deciles(col_name, recid_dec_col_name, traits))
+
+    def _count_trait_deciles(self, col_name, recid_dec_col_name, traits):
+        trait_index = _trait_index(col_name, traits)
+        decile_values = np.zeros(0, dtype=np.int64)
+        recid_counts = np.zeros((len(trait_index), 0), dtype=np.int64)
+        non_recid_counts = np.zeros((len(trait_index), 0), dtype=np.int64)
+        # (trait position, decile) of each cell in the order they were first seen
+        seen_cells = {}
+        if self.df is not None:
+            # built outside the aggregate stage, so it is timed on its own
+            self.trait_rows(col_name)
+        with self.profiler.stage("aggregate", rows=0) as record:
+            for frame in self.frames(col_name.split(",") + [recid_dec_col_name, CSVReaderConst.RECIDIVISM_COL_NAME]):
+                # grouped by trait rather than in row order when loaded, which keeps the order cells are first seen in
+                rows, trait_codes = self._chunk_rows(frame, col_name, trait_index)
+                scores = frame[recid_dec_col_name].values[rows].astype(float)
+                # people with a missing score are left out, as in score_histograms
+                keep = ~np.isnan(scores)
+                trait_codes = trait_codes[keep]
+                deciles = scores[keep].astype(np.int64)
+                recid = frame[CSVReaderConst.RECIDIVISM_COL_NAME].values[rows][keep].astype(np.int64) == 1
+
+                decile_codes, chunk_deciles = pd.factorize(deciles, sort=True)
+                num_cells = len(trait_index) * len(chunk_deciles)
+                cell_codes = trait_codes * len(chunk_deciles) + decile_codes
+                shape = (len(trait_index), len(chunk_deciles))
+                chunk_recid_counts = np.bincount(cell_codes[recid], minlength=num_cells).reshape(shape)
+                chunk_non_recid_counts = np.bincount(cell_codes[~recid], minlength=num_cells).reshape(shape)
+                for cell in pd.unique(cell_codes):
+                    seen_cells.setdefault((cell // len(chunk_deciles), chunk_deciles[cell % len(chunk_deciles)]), None)
+
+                # line up the deciles seen so far with this chunk's before adding the counts
+                all_deciles = np.union1d(decile_values, chunk_deciles)
+                merged_recid_counts = np.zeros((len(trait_index), len(all_deciles)), dtype=np.int64)
+                merged_non_recid_counts = np.zeros((len(trait_index), len(all_deciles)), dtype=np.int64)
+                for counts, merged, values in [(recid_counts, merged_recid_counts, decile_values),
+                                               (non_recid_counts, merged_non_recid_counts, decile_values),
+                                               (chunk_recid_counts, merged_recid_counts, chunk_deciles),
+                                               (chunk_non_recid_counts, merged_non_recid_counts, chunk_deciles)]:
+                    merged[:, np.searchsorted(all_deciles, values)] += counts
+                decile_values, recid_counts, non_recid_counts = all_deciles, merged_recid_counts, merged_non_recid_counts
+                record["rows"] += len(frame)
+
+        cell_order = sorted(seen_cells, key=lambda cell: cell[0])
+        return {"trait_index": trait_index,
+                "decile_values": decile_values,
+                "recid_counts": recid_counts,
+                "non_recid_counts": non_recid_counts,
+                "cell_order": [(trait_pos, np.searchsorted(decile_values, decile))
+                               for trait_pos, decile in cell_order]}
+
+    def outcome_histograms(self, col_name, recid_dec_col_name, traits, outcome_cols):
+        '''
+        Histograms of score per trait, split by each outcome column, i.e. two_year_recid and is_violent_recid,
+        for the error models of error_models.py. Every outcome column is counted in the same pass, chunk by
+        chunk when streaming, so any number of models over them cost one read of the data. Returns the
+        trait index, the distinct scores and for each outcome column, the (positive, negative) histograms
+        of shape (n_traits, n_scores). People with a missing score are left out, and those missing an
+        outcome are left out of its histograms.
+        '''
+        return self.cached("outcome_histograms", [col_name, recid_dec_col_name], traits, tuple(outcome_cols),
+                           lambda: self._outcome_histograms(col_name, recid_dec_col_name, traits, outcome_cols))
+
+    def _outcome_histograms(self, col_name, recid_dec_col_name, traits, outcome_cols):
+        if self.df is not None:
+            self.use_columns(outcome_cols)
+            # built outside the aggregate stage, so it is timed on its own
+            self.trait_rows(col_name)
+        trait_index = _trait_index(col_name, traits)
+        score_values = np.zeros(0, dtype=float)
+        histograms = dict((outcome_col, (np.zeros((len(trait_index), 0), dtype=np.int64),
+                                         np.zeros((len(trait_index), 0), dtype=np.int64)))
+                          for outcome_col in outcome_cols)
+        with self.profiler.stage("aggregate", rows=0) as record:
+            for frame in self.frames(col_name.split(",") + [recid_dec_col_name] + list(outcome_cols)):
+                rows, codes = self._chunk_rows(frame, col_name, trait_index)
+                scores = frame[recid_dec_col_name].values[rows].astype(float)
+                all_scores = np.union1d(score_values, pd.unique(scores[~np.isnan(scores)]))
+                for outcome_col in outcome_cols:
+                    outcomes = frame[outcome_col].values[rows].astype(float)
+                    # people missing the outcome are left out of its histograms, not counted as without it
+                    outcome_codes = np.where(np.isnan(outcomes), -1, codes)
+                    chunk_scores, positive_hist, negative_hist = score_histograms(outcome_codes, len(trait_index),
+                                                                                  scores, outcomes == 1)
+                    # line up the scores seen so far with this chunk's before adding the counts
+                    merged = []
+                    for hist, chunk_hist in zip(histograms[outcome_col], [positive_hist, negative_hist]):
+                        merged_hist = np.zeros((len(trait_index), len(all_scores)), dtype=np.int64)
+                        merged_hist[:, np.searchsorted(all_scores, score_values)] += hist
+                        merged_hist[:, np.searchsorted(all_scores, chunk_scores)] += chunk_hist
+                        merged.append(merged_hist)
+                    histograms[outcome_col] = tuple(merged)
+                score_values = all_scores
+                record["rows"] += len(frame)
+        return {"trait_index": trait_index,
+                "score_values": score_values,
+                "histograms": histograms}
+
+    def trait_curves(self, col_name, recid_dec_col_name, thresholds):
+        '''
+        False positive and negative curves of every trait in col_name, over the sorted thresholds, with the
+        number of people with and without recidivism in each trait
+        '''
+        self.require_loaded("The threshold sweeps")
+        return self.cached("trait_curves", [col_name, recid_dec_col_name], None, tuple(thresholds),
+                           lambda: self._sweep_trait_curves(col_name, recid_dec_col_name, thresholds))
+
+    def _sweep_trait_curves(self, col_name, recid_dec_col_name, thresholds):
+        traits = self.trait_counts(col_name).index
+        df = self.df
+        trait_rows = self.trait_rows(col_name, df)
+        with self.profiler.stage("aggregate", rows=len(df)):
+            trait_codes = trait_rows.group_codes(traits)
+            scores = df[recid_dec_col_name].values.astype(float)
+            recid = df[CSVReaderConst.RECIDIVISM_COL_NAME].values.astype(np.int64) == 1
+            score_values, recid_hist, non_recid_hist = score_histograms(trait_codes, len(traits), scores, recid)
+            thresholds = sorted(thresholds)
+            false_pos, false_neg = sweep_thresholds(score_values, recid_hist, non_recid_hist, thresholds)
+            # people with a missing score aren't in the histograms, but still count towards the size of their trait
+            group_sizes = np.bincount(trait_codes[trait_codes >= 0], minlength=len(traits))
+        return {"traits": traits,
+                "thresholds": thresholds,
+                "false_pos": false_pos,
+                "false_neg": false_neg,
+                "recid_totals": recid_hist.sum(axis=1),
+                "non_recid_totals": non_recid_hist.sum(axis=1),
+                "group_sizes": group_sizes}
+
+
+class BaseAnalyzer(object):
+    # columns loaded up front when none are given, every other column is loaded by the first command using it
+    default_columns = [CSVReaderConst.RECIDIVISM_COL_NAME]
+
+    def __init__(self, filepath_in, columns=None, chunksize=None, profiler=None, mmap=False, session=None):
+        '''
+        Opens an AnalysisSession of the CSV, see AnalysisSession for the arguments, loading default_columns
+        if no columns are given. Give the session of another analyzer instead to share its loaded dataset,
+        row indexes, cached results, profiler and renderer, without loading the CSV again.
+        '''
+        if columns is None:
+            columns = self.default_columns
+        if session is None:
+            session = AnalysisSession(filepath_in, columns=columns, chunksize=chunksize, profiler=profiler, mmap=mmap)
+        self.session = session
+
+    @property
+    def plot_filepath(self):
+        return self.session.filepath
+
+    @property
+    def df(self):
+        return self.session.df
+
+    @property
+    def profiler(self):
+        return self.session.profiler
+
+    @property
+    def renderer(self):
+        return self.session.renderer
+
+    @renderer.setter
+    def renderer(self, renderer):
+        self.session.renderer = renderer
+
+    @property
+    def results(self):
+        return self.session.results
+
+    @results.setter
+    def results(self, results):
+        self.session.results = results
+
+    def _plot(self, name, draw_func, *args):
+        self.session.plot(name, draw_func, *args)
+
+    def _traits_or_all(self, col_name, traits):
+        # [] means every trait in col_name
+        if traits == []:
+            trait_dict = self.trait_breakdown(col_name=col_name)
+            traits = list(trait_dict.index)
+        return traits
+
+    def trait_breakdown(self, col_name):
+        '''
+        Returns a dictionary of each different trait, and its count within a given column
+        '''
+        breakdown = self.session.trait_counts(col_name.lower())
+        print(breakdown)
+        return breakdown
+
+    def error_stats(self, col_name, recid_dec_col_name, traits):
+        return self.session.error_stats(col_name, recid_dec_col_name, traits)
+
+    def plot_recid(self, col_name, attr, recid_dec_col_name):
+        '''
+        Plots the breakdown of those who actually commit recidivism by the recidivism score they received
+        '''
+        recid_table = self.session.recid_table(col_name, attr, recid_dec_col_name.lower())
+        title = "{0!s}, {1!s} = {2!s}".format(recid_dec_col_name.capitalize(), col_name.capitalize(), attr.capitalize())
+        self._plot("recid_{0!s}_{1!s}_{2!s}".format(col_name, attr, recid_dec_col_name), self._draw_recid, recid_table, title)
+        return recid_table
+
+    def _draw_recid(self, fig, recid_table, title):
+        fig.set_size_inches(8, 8)
+        recid_table.plot(kind="bar", stacked=True, title=title, ax=fig.add_subplot(111))
+
+
+class BaseShell(cmd.Cmd):
+    intro = 'Welcome to the analyzer shell. Type help or ? to list commands.\n'
+    prompt = '(analyzer) '
+    # result of the last command as a DataFrame, used by batch_runner to write structured results
+    last_result = None
+    # DataAnalyzer class of the script, set by each script's AnalyzerShell
+    analyzer_class = BaseAnalyzer
+
+    def setup(self, file_path, columns=None, chunksize=None, profiler=None, mmap=False, session=None):
+        self.data_analyzer = self.analyzer_class(file_path, columns=columns, chunksize=chunksize, profiler=profiler,
+                                                 mmap=mmap, session=session)
+
+    def onecmd(self, line):
+        # with profiling on, reports the stages of every command once it is done
+        with self.data_analyzer.profiler.command(line):
+            return cmd.Cmd.onecmd(self, line)
+
+    def _parse_traits(self, col_name, arg):
+        '''
+        Traits separated by ", ", or [] for ALL. With several columns, i.e. race,sex, the values of a trait
+        are separated by "/", i.e. African-American/Male
+        '''
+        traits = arg.split(", ")
+        if (traits[0] == "ALL"):
+            return []
+        if "," in col_name:
+            return [tuple(trait.split("/")) for trait in traits]
+        return traits
+
+    def do_trait_breakdown(self, arg):
+        'Get a percentage and count breakdown of specified argument'
+        self.last_result = self.data_analyzer.trait_breakdown(col_name=arg).to_frame()
+
+    def do_plot_recid(self, arg):
+        'Plot the value of recidivism decile, with a stacked chart of how many actually had recidivism for this attribute.\n \
+        i.e. plot_recid race Caucasian decile_score'
+        split_up = arg.split(" ")
+        self.last_result = self.data_analyzer.plot_recid(*split_up)
+
+    def do_render(self, arg):
+        'Write plots to files in the background instead of showing them, optionally giving the formats, or "off" to show them again.\n \
+        i.e. render ./figures OR render ./figures png,svg OR render off'
+        if self.data_analyzer.renderer is not None:
+            self.data_analyzer.renderer.close()
+            self.data_analyzer.renderer = None
+        if arg.strip() != "off":
+            split_up = arg.split(" ")
+            formats = split_up[1].split(",") if len(split_up) > 1 else DEFAULT_FORMATS
+            self.data_analyzer.renderer = FigureRenderer(split_up[0], formats=formats)
+
+    def do_cache(self, arg):
+        'Show how many results are cached. Give a directory to also keep results there for later sessions, "off" to only keep them in memory, or "clear" to drop them all.\n \
+        i.e. cache OR cache ./results OR cache off OR cache clear'
+        arg = arg.strip()
+        results = self.data_analyzer.results
+        if arg == "clear":
+            results.clear()
+        elif arg:
+            results.set_cache_dir(None if arg == "off" else arg)
+        else:
+            print("{0!s} results cached in memory, {1!s} hits, {2!s} misses".format(len(results), results.hits, results.misses))
+
+    def do_profile(self, arg):
+        'Time the stages of every command, "off" to stop. Optionally give a file to append the timings to as JSON lines, and a directory to dump cProfile stats of each command to.\n \
+        i.e. profile on OR profile on ./timings.jsonl OR profile on ./timings.jsonl ./cprofile OR profile off'
+        split_up = arg.split()
+        profiler = self.data_analyzer.profiler
+        if not split_up:
+            print("Profiling is {0!s}".format("on" if profiler.enabled else "off"))
+        elif split_up[0] == "off":
+            profiler.disable()
+        elif split_up[0] == "on":
+            profiler.enable(log_path=split_up[1] if len(split_up) > 1 else None,
+                            cprofile_dir=split_up[2] if len(split_up) > 2 else None)
+        else:
+            print("Use profile on or profile off")
+
+    def do_quit(self, arg):
+        'Quit'
+        if self.data_analyzer.renderer is not None:
+            self.data_analyzer.renderer.close()
+        print('Thank you for using analyzer')
+        return True
+
+
+def run_shell(shell, argv, stream=True):
+    '''
+    The __main__ of each script, running shell on the CSV in argv, optionally followed by the comma separated
+    columns to load up front, i.e. python plot_by_attr.py scores.csv race,decile_score
+    '''
+    # --stream reads the CSV in chunks instead of loading it, for files larger than memory
+    # --profile times the stages of every command from the start, including loading the CSV
+    # --mmap maps the columns from their binary copy, shared by every process analyzing the same CSV
+    flags = ["--stream", "--profile", "--mmap"] if stream else ["--profile", "--mmap"]
+    args = [arg for arg in argv[1:] if arg not in flags]
+    if len(args) < 1:
+        print("Need filepath")
+        return 1
+    chunksize = DEFAULT_CHUNKSIZE if stream and "--stream" in argv else None
+    columns = args[1].split(",") if len(args) > 1 else None
+    profiler = Profiler()
+    if "--profile" in argv:
+        profiler.enable()
+    with profiler.command("setup {0!s}".format(args[0])):
+        shell.setup(os.path.normpath(args[0]), columns=columns, chunksize=chunksize, profiler=profiler,
+                    mmap="--mmap" in argv)
+    shell.cmdloop()
+    return 0
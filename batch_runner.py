@@ -0,0 +1,170 @@
+'''
+Runs a script of analyzer shell commands without the interactive prompt.
+
+The CSV is loaded once into the chosen script's AnalyzerShell, and every command in the script is run
+against that same DataAnalyzer. For each command, its printed output, its result as a CSV and its figures
+are written to the output directory, along with a results.json summarizing every command. Figures are
+drawn headless by a FigureRenderer in the background while the next commands run.
+
+Commands only read the dataset, so with more than one worker they are spread over a process pool. Workers
+are forked after the dataset is loaded and share it, rather than reloading it. Where workers are spawned
+instead, --mmap has them map the dataset's binary copy, rather than each loading its own.
+
+i.e. python batch_runner.py ./compas-analysis/compas-scores-two-years.csv nightly.txt ./nightly_out
+     python batch_runner.py scores.csv thresholds.txt ./out --analyzer plot_by_attr_threshold --workers 4
+     python batch_runner.py scores.csv nightly.txt ./nightly_out --profile ./timings.jsonl
+
+where nightly.txt has one shell command per line, blank lines and lines starting with # are skipped:
+    correct_for decile_score race ALL
+    correct_for_rms decile_score race ALL
+'''
+import os
+import re
+import sys
+import json
+import argparse
+import importlib
+import contextlib
+import traceback
+import multiprocessing
+import concurrent.futures
+import matplotlib
+matplotlib.use('Agg')
+import pandas as pd
+
+from plot_renderer import DEFAULT_FORMATS, FigureRenderer
+from profiler import Profiler
+
+DEFAULT_ANALYZER = "plot_by_attr"
+
+# shell of the worker process, set before forking so workers share the loaded dataset
+_shell = None
+
+
+def read_command_script(filepath):
+    '''
+    Returns the commands in a script file, one per line, skipping blank lines and # comments
+    '''
+    with open(filepath) as f:
+        lines = [line.strip() for line in f]
+    return [line for line in lines if line and not line.startswith("#")]
+
+
+def _load_shell(analyzer, filepath, columns=None, profile_log=None, mmap=False):
+    module = importlib.import_module(analyzer)
+    shell = module.AnalyzerShell()
+    profiler = Profiler()
+    if profile_log is not None:
+        profiler.enable(log_path=profile_log)
+    with profiler.command("setup {0!s}".format(filepath)):
+        shell.setup(filepath, columns=columns, profiler=profiler, mmap=mmap)
+    return shell
+
+
+def _init_worker(analyzer, filepath, columns, output_dir, formats, profile_log, mmap):
+    global _shell
+    if _shell is None:
+        # only reached when workers are spawned instead of forked, and so don't have the dataset yet
+        _shell = _load_shell(analyzer, filepath, columns, profile_log, mmap)
+    # each process renders its own figures, a forked one can't use its parent's thread
+    _shell.data_analyzer.renderer = FigureRenderer(output_dir, formats=formats)
+
+
+def _command_name(position, command):
+    return "{0:03d}_{1!s}".format(position, re.sub(r"[^A-Za-z0-9]+", "_", command).strip("_"))
+
+
+def _run_command(position, command, output_dir, wait_for_figures=False):
+    '''
+    Runs one command on the worker's shell, writing its output, result and figures under output_dir
+    '''
+    name = _command_name(position, command)
+    renderer = _shell.data_analyzer.renderer
+    renderer.prefix = "{0:03d}_".format(position)
+    first_figure = len(renderer.paths)
+    record = {"command": command, "output": name + ".txt", "result": None, "figures": [], "error": None}
+    _shell.last_result = None
+    command_name = _shell.parseline(command)[0]
+    if command_name is None or not hasattr(_shell, "do_" + command_name):
+        record["error"] = "Unknown command: {0!s}".format(command)
+        record["output"] = None
+        return record
+    with open(os.path.join(output_dir, name + ".txt"), "w") as output, contextlib.redirect_stdout(output):
+        try:
+            _shell.onecmd(command)
+        except Exception:
+            record["error"] = traceback.format_exc()
+            print(record["error"])
+
+    if isinstance(_shell.last_result, (pd.DataFrame, pd.Series)):
+        _shell.last_result.to_csv(os.path.join(output_dir, name + ".csv"))
+        record["result"] = name + ".csv"
+    record["figures"] = [os.path.basename(path) for path in renderer.paths[first_figure:]]
+    if wait_for_figures:
+        renderer.wait()
+    return record
+
+
+def run_batch(filepath, commands, output_dir, analyzer=DEFAULT_ANALYZER, workers=1, columns=None,
+              formats=DEFAULT_FORMATS, profile_log=None, mmap=False):
+    '''
+    Runs commands against one load of filepath, in parallel when workers > 1, and writes
+    output_dir/results.json. Figures are written in each of formats. Returns the list of per-command
+    records written to results.json. With a profile_log, the stages of loading and of every command are
+    timed and appended to it, by whichever process ran them. With mmap, the dataset is mapped from its
+    binary copy instead of loaded.
+    '''
+    global _shell
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    _shell = _load_shell(analyzer, filepath, columns, profile_log, mmap)
+
+    if workers <= 1:
+        _shell.data_analyzer.renderer = FigureRenderer(output_dir, formats=formats)
+        records = [_run_command(position, command, output_dir) for position, command in enumerate(commands)]
+        _shell.data_analyzer.renderer.close()
+    else:
+        context = None
+        if "fork" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("fork")
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                                    initializer=_init_worker,
+                                                    initargs=(analyzer, filepath, columns, output_dir, formats,
+                                                              profile_log, mmap)) as pool:
+            # a worker can't tell when the pool is done with it, so it finishes its figures with each command
+            futures = [pool.submit(_run_command, position, command, output_dir, True)
+                       for position, command in enumerate(commands)]
+            records = [future.result() for future in futures]
+
+    with open(os.path.join(output_dir, "results.json"), "w") as f:
+        json.dump({"dataset": filepath, "analyzer": analyzer, "commands": records}, f, indent=2)
+    return records
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Run a script of analyzer shell commands against one load of a CSV")
+    parser.add_argument("filepath", help="CSV file to analyze")
+    parser.add_argument("script", help="file of shell commands, one per line")
+    parser.add_argument("output_dir", help="directory to write results and figures to")
+    parser.add_argument("--analyzer", default=DEFAULT_ANALYZER,
+                        help="script whose shell runs the commands, i.e. plot_by_attr_threshold")
+    parser.add_argument("--workers", type=int, default=1, help="processes to run commands on")
+    parser.add_argument("--columns", default=None, help="comma separated columns to load up front, default only those the commands use, as they use them")
+    parser.add_argument("--formats", default=",".join(DEFAULT_FORMATS), help="comma separated figure formats, i.e. png,svg")
+    parser.add_argument("--profile", default=None, help="file to append the timings of each stage to as JSON lines")
+    parser.add_argument("--mmap", action="store_true", help="map the dataset from its binary copy instead of loading it")
+    args = parser.parse_args(argv[1:])
+
+    columns = args.columns.split(",") if args.columns else None
+    records = run_batch(os.path.normpath(args.filepath), read_command_script(args.script), args.output_dir,
+                        analyzer=args.analyzer, workers=args.workers, columns=columns,
+                        formats=args.formats.split(","), profile_log=args.profile, mmap=args.mmap)
+    failed = [record["command"] for record in records if record["error"] is not None]
+    print("Ran {0!s} commands, {1!s} failed".format(len(records), len(failed)))
+    for command in failed:
+        print("Failed: {0!s}".format(command))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
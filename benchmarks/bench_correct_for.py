@@ -0,0 +1,125 @@
+'''
+Benchmark for DataAnalyzer.correct_for in plot_by_attr.py, comparing the columnar engine against the
+original per-person iterrows loop it replaced. Baseline results from both are checked for equality, and
+corrected results, which are summed in a different order, for equality up to rounding.
+
+i.e. python benchmarks/bench_correct_for.py 200000
+     python benchmarks/bench_correct_for.py ./compas-analysis/compas-scores-two-years.csv
+'''
+import os
+import sys
+import math
+import time
+import contextlib
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from plot_by_attr import CSVReaderConst, DataAnalyzer
+from analysis_core import AnalysisSession
+
+RACES = ["African-American", "Caucasian", "Hispanic", "Other", "Asian", "Native American"]
+RACE_WEIGHTS = [3696, 2454, 637, 377, 32, 18]
+
+
+def synthetic_analyzer(num_rows, seed=0):
+    '''
+    Builds a DataAnalyzer over a random frame with the columns correct_for needs, without touching disk
+    '''
+    rng = np.random.RandomState(seed)
+    weights = np.asarray(RACE_WEIGHTS, dtype=float)
+    df = pd.DataFrame({"race": np.asarray(RACES)[rng.choice(len(RACES), num_rows, p=weights/weights.sum())],
+                       "decile_score": rng.randint(1, 11, num_rows),
+                       CSVReaderConst.RECIDIVISM_COL_NAME: rng.randint(0, 2, num_rows)})
+    return DataAnalyzer(None, session=AnalysisSession(None, df=df))
+
+
+def row_loop_correct_for(df, col_name, recid_dec_col_name, traits):
+    '''
+    The original two-pass iterrows implementation of correct_for, kept here as the reference
+    '''
+    baseline_error_dict = {}
+    rms_error_dict = {}
+    baseline_bias_dict = {}
+    for trait in traits:
+        group = df[df[col_name] == trait]
+        num_members = len(group)
+        total_abs_error = 0
+        total_error = 0
+        total_squared_residuals = 0
+        for index, person in group.iterrows():
+            if int(person[CSVReaderConst.RECIDIVISM_COL_NAME]) == 1:
+                person_error = float(person[recid_dec_col_name]) - CSVReaderConst.HIGHEST_RISK
+            else:
+                person_error = float(person[recid_dec_col_name]) - CSVReaderConst.LOWEST_RISK
+            total_error += person_error
+            total_squared_residuals += pow(person_error, 2)
+            total_abs_error += abs(person_error)
+        baseline_error_dict[trait] = total_abs_error/float(num_members)
+        baseline_bias_dict[trait] = total_error/float(num_members)
+        rms_error_dict[trait] = math.sqrt(total_squared_residuals/float(num_members))
+
+    new_error_dict = {}
+    new_rms_error_dict = {}
+    for trait in traits:
+        group = df[df[col_name] == trait]
+        num_members = len(group)
+        total_abs_error = 0
+        total_squared_residuals = 0
+        for index, person in group.iterrows():
+            corrected_decile = float(person[recid_dec_col_name]) - float(baseline_bias_dict[trait])
+            if int(person[CSVReaderConst.RECIDIVISM_COL_NAME]) == 1:
+                person_error = float(corrected_decile) - CSVReaderConst.HIGHEST_RISK
+            else:
+                person_error = float(corrected_decile) - CSVReaderConst.LOWEST_RISK
+            total_abs_error += abs(person_error)
+            total_squared_residuals += pow(person_error, 2)
+        new_error_dict[trait] = total_abs_error/float(num_members)
+        new_rms_error_dict[trait] = math.sqrt(total_squared_residuals/float(num_members))
+
+    return baseline_error_dict, rms_error_dict, baseline_bias_dict, new_error_dict, new_rms_error_dict
+
+
+def results_match(columnar, row_loop):
+    baseline_match = columnar[:3] == row_loop[:3]
+    corrected_match = all(np.isclose(columnar_dict[trait], row_loop_dict[trait], rtol=1e-12, atol=1e-12)
+                          for columnar_dict, row_loop_dict in zip(columnar[3:], row_loop[3:])
+                          for trait in row_loop_dict)
+    return baseline_match and corrected_match
+
+
+def time_call(func, *args, **kwargs):
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.time()
+        result = func(*args, **kwargs)
+        elapsed = time.time() - start
+    return result, elapsed
+
+
+def main(argv):
+    source = argv[1] if len(argv) > 1 else "100000"
+    col_name, recid_dec_col_name = "race", "decile_score"
+    if os.path.isfile(source):
+        # the row loop reads the frame directly, so the columns it needs are loaded up front
+        analyzer = DataAnalyzer(source, columns=[col_name, recid_dec_col_name])
+    else:
+        analyzer = synthetic_analyzer(int(source))
+    traits = list(analyzer.df[col_name].value_counts().index)
+
+    columnar, columnar_secs = time_call(analyzer.correct_for, col_name, recid_dec_col_name, traits=list(traits))
+    # the rms variant reuses the error histogram cached by the call above
+    _, cached_secs = time_call(analyzer.correct_for, col_name, recid_dec_col_name, traits=list(traits), rms=True)
+    row_loop, row_loop_secs = time_call(row_loop_correct_for, analyzer.df, col_name, recid_dec_col_name, traits)
+    if not results_match(columnar, row_loop):
+        raise AssertionError("columnar correct_for does not match the row loop")
+
+    num_rows = len(analyzer.df)
+    print("rows: {0!s}, traits: {1!s}".format(num_rows, len(traits)))
+    print("row loop: {0:.3f}s ({1:.0f} rows/s)".format(row_loop_secs, num_rows/row_loop_secs))
+    print("columnar: {0:.3f}s ({1:.0f} rows/s)".format(columnar_secs, num_rows/max(columnar_secs, 1e-9)))
+    print("speedup: {0:.1f}x".format(row_loop_secs/max(columnar_secs, 1e-9)))
+    print("rms from cache: {0:.4f}s".format(cached_secs))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
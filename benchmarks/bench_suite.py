@@ -0,0 +1,156 @@
+'''
+Benchmark suite for the analyzers, on a synthetic COMPAS-shaped CSV or a given one.
+
+Times each stage of a typical session: loading (parsing the CSV into the columnar cache, reading the
+cache back, and mapping the columns' binary copy), trait breakdown, linear and RMS correct_for,
+non-uniform correct_for, threshold sweeps for one trait and for all traits, and scoring the default
+error models. Each stage is timed on its own, then run again under tracemalloc for its peak memory.
+The result cache is turned off, so every stage really computes its results, while indexes built once
+per session, like the trait row index, are kept as they would be.
+Plots are skipped, only the analysis is timed.
+
+Reports seconds, rows/sec and peak MB per stage, and with --output appends them as one JSON line per
+run to a file, to track performance over time.
+
+i.e. python benchmarks/bench_suite.py --rows 1000000
+     python benchmarks/bench_suite.py --csv ./compas-analysis/compas-scores-two-years.csv --output bench.jsonl
+'''
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import datetime
+import resource
+import contextlib
+import tracemalloc
+import matplotlib
+matplotlib.use('Agg')
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+import plot_by_attr
+import plot_by_attr_non_uniform
+import plot_by_attr_threshold
+from csv_cache import cache_dir_for
+from result_cache import ResultCache
+from generate_compas import DEFAULT_SKEW, generate_csv
+
+COL_NAME = "race"
+RECID_DEC_COL_NAME = "decile_score"
+COLUMNS = [COL_NAME, RECID_DEC_COL_NAME]
+
+
+def _without_result_cache(analyzer):
+    # nothing is kept, so every call computes its result
+    analyzer.results = ResultCache(analyzer.plot_filepath, max_entries=0)
+    analyzer._plot = lambda *args: None
+    return analyzer
+
+
+def _load(module, filepath, cold, mmap=False):
+    if cold and os.path.isdir(cache_dir_for(filepath)):
+        shutil.rmtree(cache_dir_for(filepath))
+    return _without_result_cache(module.DataAnalyzer(filepath, columns=COLUMNS, mmap=mmap))
+
+
+def stages(filepath):
+    '''
+    Returns (name, func) pairs for every stage, funcs taking no arguments. The analyzers the stages run on
+    share one session, loaded before any stage is timed.
+    '''
+    analyzer = _load(plot_by_attr, filepath, cold=False)
+    non_uniform_analyzer = _without_result_cache(plot_by_attr_non_uniform.DataAnalyzer(filepath, session=analyzer.session))
+    threshold_analyzer = _without_result_cache(plot_by_attr_threshold.DataAnalyzer(filepath, session=analyzer.session))
+    return [("load_csv", lambda: _load(plot_by_attr, filepath, cold=True)),
+            ("load_cached", lambda: _load(plot_by_attr, filepath, cold=False)),
+            ("load_mmap", lambda: _load(plot_by_attr, filepath, cold=False, mmap=True)),
+            ("trait_breakdown", lambda: analyzer.trait_breakdown(COL_NAME)),
+            ("correct_for", lambda: analyzer.correct_for(COL_NAME, RECID_DEC_COL_NAME)),
+            ("correct_for_rms", lambda: analyzer.correct_for(COL_NAME, RECID_DEC_COL_NAME, rms=True)),
+            ("non_uniform_correct_for", lambda: non_uniform_analyzer.correct_for(COL_NAME, RECID_DEC_COL_NAME)),
+            ("threshold_sweep", lambda: threshold_analyzer.threshold_sweep(COL_NAME, "ALL", RECID_DEC_COL_NAME)),
+            ("threshold_sweep_all_traits",
+             lambda: threshold_analyzer.threshold_sweep_all_traits(COL_NAME, RECID_DEC_COL_NAME)),
+            ("score_models", lambda: analyzer.score_models(COL_NAME, RECID_DEC_COL_NAME))]
+
+
+def run_stage(func, repeat=1):
+    '''
+    Returns the fastest of repeat timed runs of func in seconds, and its peak traced memory in bytes from
+    one more run
+    '''
+    seconds = None
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(repeat):
+            start = time.time()
+            func()
+            elapsed = time.time() - start
+            seconds = elapsed if seconds is None else min(seconds, elapsed)
+        tracemalloc.start()
+        try:
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return seconds, peak
+
+
+def run_suite(filepath, repeat=1):
+    '''
+    Runs every stage on filepath, returning a record per stage with its seconds, rows/sec and peak MB
+    '''
+    with open(filepath, "rb") as f:
+        num_rows = max(sum(1 for _ in f) - 1, 0)
+    records = []
+    for name, func in stages(filepath):
+        seconds, peak = run_stage(func, repeat=repeat)
+        records.append({"stage": name,
+                        "rows": num_rows,
+                        "seconds": seconds,
+                        "rows_per_sec": num_rows / max(seconds, 1e-9),
+                        "peak_mb": peak / float(1 << 20)})
+    return records
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Time each analysis stage on a synthetic or given CSV")
+    parser.add_argument("--csv", default=None, help="CSV to benchmark, a synthetic one is generated if not given")
+    parser.add_argument("--rows", type=int, default=100000, help="rows of the synthetic CSV")
+    parser.add_argument("--skew", type=float, default=DEFAULT_SKEW, help="skew of the synthetic CSV's races")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per stage, the fastest is reported")
+    parser.add_argument("--output", default=None, help="file to append this run's results to as a JSON line")
+    args = parser.parse_args(argv[1:])
+
+    temp_dir = None
+    filepath = args.csv
+    if filepath is None:
+        temp_dir = tempfile.mkdtemp(prefix="bench_suite_")
+        filepath = generate_csv(os.path.join(temp_dir, "synthetic.csv"), num_rows=args.rows, skew=args.skew)
+    try:
+        records = run_suite(filepath, repeat=args.repeat)
+    finally:
+        if temp_dir is not None:
+            shutil.rmtree(temp_dir)
+
+    print("{0:<28}{1:>12}{2:>16}{3:>12}".format("stage", "seconds", "rows/sec", "peak MB"))
+    for record in records:
+        print("{0:<28}{1:>12.4f}{2:>16.0f}{3:>12.1f}".format(record["stage"], record["seconds"],
+                                                             record["rows_per_sec"], record["peak_mb"]))
+    # ru_maxrss is in kilobytes on Linux
+    max_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    print("Process peak resident memory: {0:.1f} MB".format(max_rss_mb))
+    if args.output is not None:
+        with open(args.output, "a") as f:
+            f.write(json.dumps({"time": datetime.datetime.now().isoformat(),
+                                "csv": args.csv,
+                                "rows": records[0]["rows"],
+                                "skew": None if args.csv else args.skew,
+                                "max_rss_mb": max_rss_mb,
+                                "stages": records}) + "\n")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
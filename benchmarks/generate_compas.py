@@ -0,0 +1,110 @@
+'''
+Writes synthetic CSVs with the columns of the COMPAS two year recidivism export, for benchmarks and for
+trying the analyzers without the real data.
+
+Races follow their proportions in the real export raised to the power of skew, so skew 0 gives equal
+groups, 1 the real proportions and higher values rarer small groups. Each race's decile scores are
+shifted by a race specific amount, and recidivism becomes more likely with the score, so the analyzers
+find some bias to correct. Rows are generated and written in chunks, so files of 100M rows don't need
+to fit in memory, and the same seed always writes the same file.
+
+i.e. python benchmarks/generate_compas.py ./synthetic_1m.csv --rows 1000000
+     python benchmarks/generate_compas.py ./skewed.csv --rows 100000 --skew 2 --seed 7
+'''
+import os
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+
+DEFAULT_ROWS = 10000
+DEFAULT_SKEW = 1.0
+CHUNK_ROWS = 1000000
+
+RACES = ["African-American", "Caucasian", "Hispanic", "Other", "Asian", "Native American"]
+RACE_COUNTS = [3696, 2454, 637, 377, 32, 18]
+# added to each race's mean decile score
+RACE_SCORE_SHIFTS = [0.8, -0.6, -0.8, -1.0, -1.2, 0.2]
+AGE_CATS = ["Less than 25", "25 - 45", "Greater than 45"]
+CHARGE_DEGREES = ["F", "M"]
+FIRST_DATE = pd.Timestamp("2013-01-01")
+DATE_RANGE_DAYS = 730
+
+
+def race_weights(skew=DEFAULT_SKEW):
+    weights = np.asarray(RACE_COUNTS, dtype=float) ** skew
+    return weights / weights.sum()
+
+
+def score_text(deciles):
+    return np.where(deciles <= 4, "Low", np.where(deciles <= 7, "Medium", "High"))
+
+
+def synthetic_chunk(rng, first_id, num_rows, skew=DEFAULT_SKEW):
+    '''
+    Returns num_rows synthetic people with ids from first_id
+    '''
+    race_codes = rng.choice(len(RACES), num_rows, p=race_weights(skew))
+    age = rng.randint(18, 70, num_rows)
+    age_cats = np.where(age < 25, 0, np.where(age <= 45, 1, 2))
+    priors = rng.poisson(2.5, num_rows)
+    # younger people and those with more priors score higher
+    mean_score = 4.5 + np.asarray(RACE_SCORE_SHIFTS)[race_codes] + 0.3 * np.minimum(priors, 10) - 0.05 * (age - 35)
+    deciles = np.clip(np.rint(mean_score + rng.normal(0, 2.2, num_rows)), 1, 10).astype(np.int64)
+    violent_deciles = np.clip(deciles + rng.randint(-2, 3, num_rows), 1, 10)
+    two_year_recid = (rng.random_sample(num_rows) < 0.08 + 0.065 * deciles).astype(np.int64)
+    is_violent_recid = two_year_recid * (rng.random_sample(num_rows) < 0.25)
+
+    screening_days = rng.randint(0, DATE_RANGE_DAYS, num_rows)
+    screening_dates = FIRST_DATE + pd.to_timedelta(screening_days, unit="D")
+    jail_in = screening_dates - pd.to_timedelta(rng.randint(0, 3, num_rows), unit="D")
+    jail_out = jail_in + pd.to_timedelta(rng.exponential(10, num_rows).astype(np.int64), unit="D")
+    ids = np.arange(first_id, first_id + num_rows)
+    return pd.DataFrame({"id": ids,
+                         "name": pd.Series(ids).map("person {0!s}".format),
+                         "sex": np.where(rng.random_sample(num_rows) < 0.81, "Male", "Female"),
+                         "age": age,
+                         "age_cat": np.asarray(AGE_CATS)[age_cats],
+                         "race": np.asarray(RACES)[race_codes],
+                         "priors_count": priors,
+                         "c_charge_degree": np.asarray(CHARGE_DEGREES)[rng.randint(0, 2, num_rows)],
+                         "decile_score": deciles,
+                         "score_text": score_text(deciles),
+                         "v_decile_score": violent_deciles,
+                         "v_score_text": score_text(violent_deciles),
+                         "two_year_recid": two_year_recid,
+                         "is_violent_recid": is_violent_recid,
+                         "screening_date": screening_dates.strftime("%Y-%m-%d"),
+                         "c_jail_in": jail_in.strftime("%Y-%m-%d %H:%M:%S"),
+                         "c_jail_out": jail_out.strftime("%Y-%m-%d %H:%M:%S")})
+
+
+def generate_csv(filepath, num_rows=DEFAULT_ROWS, skew=DEFAULT_SKEW, seed=0):
+    '''
+    Writes num_rows synthetic people to filepath, CHUNK_ROWS at a time
+    '''
+    rng = np.random.RandomState(seed)
+    first_id = 0
+    while True:
+        chunk = synthetic_chunk(rng, first_id, min(CHUNK_ROWS, num_rows - first_id), skew=skew)
+        chunk.to_csv(filepath, index=False, mode="w" if first_id == 0 else "a", header=first_id == 0)
+        first_id += len(chunk)
+        if first_id >= num_rows:
+            return filepath
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Write a synthetic CSV with the columns of the COMPAS export")
+    parser.add_argument("filepath", help="CSV file to write")
+    parser.add_argument("--rows", type=int, default=DEFAULT_ROWS, help="number of people")
+    parser.add_argument("--skew", type=float, default=DEFAULT_SKEW,
+                        help="0 for equal sized races, 1 for their real proportions, higher for rarer small races")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv[1:])
+    generate_csv(os.path.normpath(args.filepath), num_rows=args.rows, skew=args.skew, seed=args.seed)
+    print("Wrote {0!s} rows to {1!s}".format(args.rows, args.filepath))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,101 @@
+'''
+Sufficient statistics for bias correction.
+
+Everything correct_for reports comes from each person's error, their score minus the score we would
+expect given whether recidivism occured. Since scores are discrete, each group's errors only take a
+handful of distinct values. ErrorStats keeps a histogram of those values per group. Bias, absolute error
+and RMS error follow from the histogram, both before and after correcting each group by its bias, so
+the data only has to be read once.
+'''
+import numpy as np
+import pandas as pd
+
+
+class ErrorStats(object):
+    '''
+    Histogram of errors per group. counts[g, v] is the number of people in groups[g] with error error_values[v].
+    '''
+    def __init__(self, groups, error_values, counts):
+        self.groups = pd.Index(groups)
+        self.error_values = np.asarray(error_values, dtype=float)
+        self.counts = np.asarray(counts, dtype=np.int64).reshape(len(self.groups), len(self.error_values))
+
+    @classmethod
+    def from_errors(cls, groups, group_codes, errors):
+        '''
+        Builds the histogram from each person's group position in groups and their error
+        '''
+        value_codes, error_values = pd.factorize(np.asarray(errors, dtype=float), sort=True)
+        keep = (group_codes >= 0) & (value_codes >= 0)
+        num_values = len(error_values)
+        counts = np.bincount(group_codes[keep] * num_values + value_codes[keep], minlength=len(groups) * num_values)
+        return cls(groups, error_values, counts)
+
+    def merge(self, other):
+        '''
+        Returns the stats of both sets of people together, used to add up chunks of a CSV or several CSVs.
+        Groups only in other are added after the groups of self.
+        '''
+        groups = self.groups.append(other.groups[~other.groups.isin(self.groups)])
+        error_values = np.union1d(self.error_values, other.error_values)
+        counts = np.zeros((len(groups), len(error_values)), dtype=np.int64)
+        for stats in (self, other):
+            rows = groups.get_indexer(stats.groups)
+            counts[np.ix_(rows, np.searchsorted(error_values, stats.error_values))] += stats.counts
+        return ErrorStats(groups, error_values, counts)
+
+    def members(self):
+        return self.counts.sum(axis=1)
+
+    def _total(self, func, corrected):
+        errors = self.error_values[np.newaxis, :]
+        if corrected:
+            # everyone's score, and so their error, is shifted down by their group's bias
+            errors = errors - self.bias()[:, np.newaxis]
+        return (self.counts * func(errors)).sum(axis=1)
+
+    def _mean(self, total):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return total / self.members().astype(float)
+
+    def total_error(self, corrected=False):
+        return self._total(lambda errors: errors, corrected)
+
+    def total_abs_error(self, corrected=False):
+        return self._total(np.abs, corrected)
+
+    def total_squared_error(self, corrected=False):
+        return self._total(np.square, corrected)
+
+    def bias(self, corrected=False):
+        '''
+        Mean error per group. If mostly over-predicted, bias positive. if under, negative.
+        Once corrected for, the bias is 0 up to rounding.
+        '''
+        return self._mean(self.total_error(corrected))
+
+    def abs_error(self, corrected=False):
+        return self._mean(self.total_abs_error(corrected))
+
+    def rms_error(self, corrected=False):
+        return np.sqrt(self._mean(self.total_squared_error(corrected)))
+
+    def mean_loss(self, func, corrected=False):
+        '''
+        Mean of func(errors) per group, func being any elementwise loss, i.e. the Huber loss
+        '''
+        return self._mean(self._total(func, corrected))
+
+
+def bias_table(stats):
+    '''
+    Per group members, baseline and corrected error and bias, the same numbers correct_for prints
+    '''
+    return pd.DataFrame({"members": stats.members(),
+                         "baseline_error": stats.abs_error(),
+                         "rms_error": stats.rms_error(),
+                         "baseline_bias": stats.bias(),
+                         "new_error": stats.abs_error(corrected=True),
+                         "new_rms_error": stats.rms_error(corrected=True)},
+                        index=stats.groups,
+                        columns=["members", "baseline_error", "rms_error", "baseline_bias", "new_error", "new_rms_error"])
@@ -0,0 +1,83 @@
+'''
+Bootstrap confidence intervals for the per group bias and error correct_for reports.
+
+Resampling a group's people with replacement only changes how many of them have each error value, so
+instead of resampling rows, each replicate draws the group's error histogram from a multinomial with the
+group's size and observed error frequencies. A batch of replicates for every group is one multinomial
+draw, whose metrics come from ErrorStats like the point estimates do. Batches run on a process pool, and
+each has its own seed spawned from one seed, so the intervals only depend on the seed and number of
+replicates, not on the number of workers.
+'''
+import concurrent.futures
+import numpy as np
+import pandas as pd
+
+from bias_stats import ErrorStats
+
+DEFAULT_REPLICATES = 2000
+DEFAULT_CONFIDENCE = 0.95
+# replicates drawn per task, small enough that a batch of every group's histograms stays in memory
+BATCH_REPLICATES = 250
+METRICS = ["baseline_bias", "baseline_error", "rms_error", "new_error", "new_rms_error"]
+
+
+def metrics_of(stats):
+    '''
+    Returns each metric of METRICS per group of stats
+    '''
+    return {"baseline_bias": stats.bias(),
+            "baseline_error": stats.abs_error(),
+            "rms_error": stats.rms_error(),
+            "new_error": stats.abs_error(corrected=True),
+            "new_rms_error": stats.rms_error(corrected=True)}
+
+
+def replicate_metrics(error_values, counts, num_replicates, seed):
+    '''
+    Draws num_replicates bootstrap histograms of every group, the rows of counts. Returns each metric as an
+    array of shape (num_replicates, groups).
+    '''
+    rng = np.random.default_rng(seed)
+    members = counts.sum(axis=1)
+    frequencies = counts / members[:, np.newaxis].astype(float)
+    samples = rng.multinomial(members, frequencies, size=(num_replicates, len(members)))
+    # every (replicate, group) is a group of its own
+    replicates = ErrorStats(np.arange(samples.shape[0] * samples.shape[1]), error_values,
+                            samples.reshape(-1, len(error_values)))
+    return dict((metric, values.reshape(num_replicates, len(members)))
+                for metric, values in metrics_of(replicates).items())
+
+
+def bootstrap_intervals(stats, num_replicates=DEFAULT_REPLICATES, confidence=DEFAULT_CONFIDENCE, workers=None, seed=0):
+    '''
+    Returns a frame indexed by the groups of stats with each metric of METRICS, and the low and high ends
+    of its percentile bootstrap interval as <metric>_low and <metric>_high. Every group needs members.
+    Replicates are spread over workers processes, one per core by default, or drawn here if workers is 1.
+    '''
+    members = stats.members()
+    if (members == 0).any():
+        raise ValueError("No members found in group {0!s}".format(stats.groups[np.argmax(members == 0)]))
+    batch_sizes = [BATCH_REPLICATES] * (num_replicates // BATCH_REPLICATES)
+    if num_replicates % BATCH_REPLICATES:
+        batch_sizes.append(num_replicates % BATCH_REPLICATES)
+    seeds = np.random.SeedSequence(seed).spawn(len(batch_sizes))
+
+    if workers == 1:
+        batches = [replicate_metrics(stats.error_values, stats.counts, size, batch_seed)
+                   for size, batch_seed in zip(batch_sizes, seeds)]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(replicate_metrics, stats.error_values, stats.counts, size, batch_seed)
+                       for size, batch_seed in zip(batch_sizes, seeds)]
+            batches = [future.result() for future in futures]
+
+    tail = (1 - confidence) / 2 * 100
+    estimates = metrics_of(stats)
+    intervals = {}
+    columns = []
+    for metric in METRICS:
+        values = np.concatenate([batch[metric] for batch in batches])
+        low, high = np.percentile(values, [tail, 100 - tail], axis=0)
+        intervals[metric], intervals[metric + "_low"], intervals[metric + "_high"] = estimates[metric], low, high
+        columns.extend([metric, metric + "_low", metric + "_high"])
+    return pd.DataFrame(intervals, index=stats.groups, columns=columns)
@@ -0,0 +1,258 @@
+'''
+Columnar on-disk cache for the CSV files the analyzers load.
+
+The first time a CSV is read it is parsed with pandas and written to a "<csv>.cache" directory next to it,
+as a Feather file when pyarrow is installed, or as one .npy file per column otherwise. Later loads read
+the cache back instead of parsing the CSV, and only the columns that were asked for.
+
+The CSV is parsed and written about CACHE_CHUNK_BYTES of it at a time, one part file per chunk, so building
+the cache never holds more than one chunk as parsed by pandas, whatever the size of the CSV. Reading a
+column back joins its parts.
+
+The cache is keyed on the size, mtime and content hash of the CSV. Size and mtime are checked first. If
+either changed, the content is hashed, and the cache is only rebuilt when the hash differs as well.
+
+The cache is built in a directory of its own and renamed into place, under a "<csv>.cache.lock" file lock,
+so processes opening a CSV at once take turns: the first builds the cache, and the rest find it fresh once
+they get the lock and read it instead of building it again.
+'''
+import os
+import json
+import shutil
+import hashlib
+import contextlib
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:
+    # no file locks, i.e. on Windows, where processes building the same cache at once may fail
+    fcntl = None
+
+try:
+    import pyarrow
+    import pyarrow.feather as feather
+except ImportError:
+    pyarrow = None
+    feather = None
+
+CACHE_SUFFIX = ".cache"
+LOCK_SUFFIX = ".lock"
+META_FILE = "meta.json"
+FEATHER_FILE = "data_{0!s}.feather"
+NPY_FILE = "col_{0!s}_{1!s}.npy"
+CACHE_VERSION = 2
+# bytes of the CSV parsed and written at a time when building the cache
+CACHE_CHUNK_BYTES = 1 << 22
+# bytes of the first lines the length of a row is estimated from
+ROW_SAMPLE_BYTES = 1 << 16
+HASH_CHUNK_BYTES = 1 << 20
+
+
+def cache_dir_for(filepath):
+    return os.path.abspath(filepath) + CACHE_SUFFIX
+
+
+@contextlib.contextmanager
+def file_lock(lock_path):
+    '''
+    Holds an exclusive lock on lock_path, creating it if need be, so one process at a time runs the block
+    '''
+    if fcntl is None:
+        yield
+        return
+    with open(lock_path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def file_content_hash(filepath):
+    '''
+    Returns the sha1 hex digest of a file, read in chunks
+    '''
+    digest = hashlib.sha1()
+    with open(filepath, "rb") as f:
+        chunk = f.read(HASH_CHUNK_BYTES)
+        while chunk:
+            digest.update(chunk)
+            chunk = f.read(HASH_CHUNK_BYTES)
+    return digest.hexdigest()
+
+
+def cached_content_hash(filepath):
+    '''
+    Returns the content hash of a CSV, from its cache when the cache is fresh instead of rehashing it
+    '''
+    cache_dir = cache_dir_for(filepath)
+    meta = _read_meta(cache_dir)
+    if meta is not None and _is_fresh(filepath, cache_dir, meta):
+        return meta["hash"]
+    return file_content_hash(filepath)
+
+
+def _read_meta(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, META_FILE)) as f:
+            meta = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+    if meta.get("version") != CACHE_VERSION:
+        return None
+    return meta
+
+
+def _write_meta(cache_dir, meta):
+    meta_path = os.path.join(cache_dir, META_FILE)
+    with open(meta_path + ".{0!s}.tmp".format(os.getpid()), "w") as f:
+        json.dump(meta, f)
+    os.rename(meta_path + ".{0!s}.tmp".format(os.getpid()), meta_path)
+
+
+def _is_fresh(filepath, cache_dir, meta):
+    '''
+    Checks the cache against the CSV by size and mtime, then by content hash if those changed
+    '''
+    stat = os.stat(filepath)
+    if meta["size"] == stat.st_size and meta["mtime"] == stat.st_mtime:
+        return True
+    if meta["size"] != stat.st_size or meta["hash"] != file_content_hash(filepath):
+        return False
+    # same content, only touched, so keep the cache and remember the new mtime
+    meta["mtime"] = stat.st_mtime
+    _write_meta(cache_dir, meta)
+    return True
+
+
+def _chunk_rows(filepath):
+    '''
+    Rows in about CACHE_CHUNK_BYTES of the CSV, from the length of its first lines
+    '''
+    with open(filepath, "rb") as f:
+        f.readline()
+        sample = f.readlines(ROW_SAMPLE_BYTES)
+    if not sample:
+        return 1
+    return max(1, CACHE_CHUNK_BYTES * len(sample) // sum(len(line) for line in sample))
+
+
+def _write_cache(filepath, cache_dir, chunks):
+    '''
+    Writes each chunk of the parsed CSV as a part of the cache, so only one chunk is in memory at a time.
+    The parts go to a directory of this process, which then replaces the old cache, so no other process
+    ever reads a cache half written.
+    '''
+    build_dir = cache_dir + ".{0!s}.tmp".format(os.getpid())
+    if os.path.isdir(build_dir):
+        shutil.rmtree(build_dir)
+    os.makedirs(build_dir)
+
+    columns = None
+    formats = []
+    for part, chunk in enumerate(chunks):
+        if columns is None:
+            columns = [str(col_name) for col_name in chunk.columns]
+        formats.append(_write_part(build_dir, part, chunk))
+
+    stat = os.stat(filepath)
+    _write_meta(build_dir, {"version": CACHE_VERSION,
+                            "size": stat.st_size,
+                            "mtime": stat.st_mtime,
+                            "hash": file_content_hash(filepath),
+                            "formats": formats,
+                            "columns": columns})
+    if os.path.isdir(cache_dir):
+        old_dir = cache_dir + ".{0!s}.old".format(os.getpid())
+        os.rename(cache_dir, old_dir)
+        shutil.rmtree(old_dir)
+    os.rename(build_dir, cache_dir)
+
+
+def _write_part(cache_dir, part, chunk):
+    '''
+    Writes one chunk of the CSV, returning the format it was written in
+    '''
+    if feather is not None:
+        try:
+            feather.write_feather(chunk, os.path.join(cache_dir, FEATHER_FILE.format(part)), compression="uncompressed")
+            return "feather"
+        except (TypeError, ValueError, pyarrow.ArrowException):
+            # mixed type object columns can't be stored in arrow, the numpy format pickles them instead
+            pass
+    for position, col_name in enumerate(chunk.columns):
+        np.save(os.path.join(cache_dir, NPY_FILE.format(position, part)), chunk[col_name].values, allow_pickle=True)
+    return "npy"
+
+
+def _read_cache(cache_dir, meta, columns):
+    if columns is None:
+        columns = meta["columns"]
+    missing = [col_name for col_name in columns if col_name not in meta["columns"]]
+    if missing:
+        raise KeyError("Columns not found in CSV: {0!s}".format(missing))
+
+    parts = []
+    for part, part_format in enumerate(meta["formats"]):
+        if part_format == "feather":
+            parts.append(feather.read_feather(os.path.join(cache_dir, FEATHER_FILE.format(part)), columns=list(columns)))
+            continue
+        data = {}
+        for col_name in columns:
+            position = meta["columns"].index(col_name)
+            data[col_name] = np.load(os.path.join(cache_dir, NPY_FILE.format(position, part)), allow_pickle=True)
+        parts.append(pd.DataFrame(data, columns=list(columns)))
+    # the dtypes of the parts are joined as pd.read_csv joins those of the chunks it parses, i.e. int and float to float
+    return pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+
+
+def _fresh_meta(filepath, cache_dir):
+    '''
+    The meta of the cache if it is fresh and readable here, otherwise None
+    '''
+    meta = _read_meta(cache_dir)
+    if meta is not None and "feather" in meta["formats"] and feather is None:
+        return None
+    if meta is not None and _is_fresh(filepath, cache_dir, meta):
+        return meta
+    return None
+
+
+def _built_meta(filepath):
+    cache_dir = cache_dir_for(filepath)
+    meta = _fresh_meta(filepath, cache_dir)
+    if meta is None:
+        with file_lock(cache_dir + LOCK_SUFFIX):
+            # another process may have built it while this one waited for the lock
+            meta = _fresh_meta(filepath, cache_dir)
+            if meta is None:
+                _write_cache(filepath, cache_dir, pd.read_csv(filepath, chunksize=_chunk_rows(filepath)))
+                meta = _read_meta(cache_dir)
+    return cache_dir, meta
+
+
+def fresh_cache(filepath):
+    '''
+    Returns the cache directory of a CSV and its column names, building the cache first unless it is fresh.
+    Files other formats keep in the directory are removed with it whenever the cache is rebuilt. Raises
+    IOError or OSError if the cache can't be written.
+    '''
+    cache_dir, meta = _built_meta(filepath)
+    return cache_dir, meta["columns"]
+
+
+def read_csv_cached(filepath, columns=None):
+    '''
+    Drop-in for pd.read_csv(filepath) that goes through the columnar cache. Only the given columns are
+    returned if any are given. If the cache can't be written, e.g. a read-only directory, only those
+    columns are parsed from the CSV instead.
+    '''
+    try:
+        cache_dir, meta = _built_meta(filepath)
+    except (IOError, OSError):
+        if columns is None:
+            return pd.read_csv(filepath)
+        return pd.read_csv(filepath, usecols=list(columns))[list(columns)]
+    return _read_cache(cache_dir, meta, columns)
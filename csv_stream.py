@@ -0,0 +1,34 @@
+'''
+Helpers for streaming the analysis over CSVs too large to load at once.
+
+The CSV is read in fixed size chunks of only the needed columns, so peak memory depends on the chunk
+size and not on the number of rows.
+'''
+import numpy as np
+import pandas as pd
+
+DEFAULT_CHUNKSIZE = 500000
+
+
+def read_csv_chunks(filepath, columns, chunksize=DEFAULT_CHUNKSIZE):
+    '''
+    Yields DataFrames of at most chunksize rows holding only the given columns
+    '''
+    for chunk in pd.read_csv(filepath, usecols=list(columns), chunksize=chunksize):
+        yield chunk
+
+
+def value_counts_chunked(filepath, col_name, chunksize=DEFAULT_CHUNKSIZE):
+    '''
+    Same as df[col_name].value_counts(sort=True, ascending=False), one chunk at a time. col_name can be a
+    list of columns to count each combination of their values that occurs.
+    '''
+    counts = None
+    columns = list(col_name) if isinstance(col_name, list) else [col_name]
+    for chunk in read_csv_chunks(filepath, columns, chunksize):
+        chunk_counts = chunk[col_name].value_counts(sort=False)
+        counts = chunk_counts if counts is None else counts.add(chunk_counts, fill_value=0)
+    if counts is None:
+        return pd.Series([], name=col_name, dtype=np.int64)
+    return counts.astype(np.int64).sort_values(ascending=False, kind="mergesort")
+
@@ -0,0 +1,137 @@
+'''
+Compact in-memory representation of the datasets the analyzers load.
+
+pd.read_csv keeps every string column as Python objects and every integer column as int64. Trait columns
+like race, sex and age_cat only have a handful of values, so they are stored as categoricals instead, and
+integer columns like decile_score and two_year_recid are downcast to the smallest integer type that holds
+them, int8 for both. Together with only loading the columns an analysis needs, this cuts the memory of a
+COMPAS export several times over without changing any results.
+
+TraitRowIndex groups the rows of a column by trait once, for analyzers to reuse across commands.
+'''
+import numpy as np
+import pandas as pd
+
+from csv_cache import read_csv_cached
+
+# object columns with at most this fraction of distinct values are stored as categoricals, so that
+# columns unique per row like names aren't
+MAX_CATEGORY_FRACTION = 0.5
+
+
+def compact_frame(df):
+    '''
+    Returns df with low cardinality string columns as categoricals and integer columns downcast
+    '''
+    compact = {}
+    for col_name in df.columns:
+        column = df[col_name]
+        if column.dtype == object and column.nunique() <= max(1, len(column) * MAX_CATEGORY_FRACTION):
+            column = column.astype("category")
+        elif pd.api.types.is_integer_dtype(column.dtype) and not pd.api.types.is_bool_dtype(column.dtype):
+            column = pd.to_numeric(column, downcast="integer")
+        compact[col_name] = column
+    return pd.DataFrame(compact, columns=df.columns, index=df.index)
+
+
+def load_dataset(filepath, columns=None, compact=True):
+    '''
+    Loads the given columns of a CSV (all by default) through the columnar cache, compacted unless
+    compact is False
+    '''
+    df = read_csv_cached(filepath, columns=columns)
+    return compact_frame(df) if compact else df
+
+
+def memory_usage(df):
+    '''
+    Bytes used by df, including the strings of object columns
+    '''
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+class TraitRowIndex(object):
+    '''
+    Row positions of each trait in a column, so a trait's rows can be taken in O(size of the trait)
+    instead of comparing the whole column against it. Given a frame of several columns, each trait is a
+    tuple of their values, i.e. (race, sex, age_cat), and only combinations that occur are traits.
+    '''
+    def __init__(self, column):
+        if isinstance(column, pd.DataFrame):
+            codes, traits = _combine_codes(column)
+        else:
+            codes, traits = _factorize(column)
+        self.traits = pd.Index(traits)
+        # missing values have code -1
+        self.codes = np.asarray(codes)
+        # rows sorted by trait, stable so each trait's rows stay in order. bounds[t]:bounds[t + 1] of order
+        # are the rows of trait t, after the missing ones at the start
+        sort_codes = self.codes.astype(np.int16) if len(self.traits) < np.iinfo(np.int16).max else self.codes
+        self._order = np.argsort(sort_codes, kind="stable")
+        self._bounds = np.cumsum(np.bincount(self.codes + 1, minlength=len(self.traits) + 1))
+
+    def counts(self):
+        '''
+        Number of rows of each trait, most common first, like value_counts
+        '''
+        counts = pd.Series(np.diff(self._bounds), index=self.traits, name="count")
+        return counts.sort_values(ascending=False, kind="mergesort")
+
+    def rows(self, trait):
+        '''
+        Row positions of trait, in order, empty if it isn't in the column
+        '''
+        pos = self.traits.get_indexer([trait])[0]
+        if pos < 0:
+            return np.zeros(0, dtype=self._order.dtype)
+        return self._order[self._bounds[pos]:self._bounds[pos + 1]]
+
+    def select(self, traits):
+        '''
+        Row positions of everyone with one of traits, and the position of their trait in traits. Rows are
+        grouped by trait in the order of traits, and in order within each trait.
+        '''
+        rows = [self.rows(trait) for trait in traits]
+        codes = [np.full(len(trait_rows), pos, dtype=np.intp) for pos, trait_rows in enumerate(rows)]
+        empty = [np.zeros(0, dtype=np.intp)]
+        return np.concatenate(rows + empty).astype(np.intp), np.concatenate(codes + empty)
+
+    def group_codes(self, traits):
+        '''
+        Position in traits of every row's trait, -1 for rows with none of them
+        '''
+        trait_pos = np.append(pd.Index(traits).get_indexer(self.traits), -1)
+        return trait_pos[self.codes]
+
+
+def _factorize(column):
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return column.cat.codes.values, column.cat.categories
+    return pd.factorize(column)
+
+
+def _combine_codes(frame):
+    '''
+    Codes each row of frame by its combination of values, missing if any value is. The combinations are
+    numbered in sorted order of the columns' codes, and only those that occur get a number, so sparse
+    combinations of many columns cost no more than the rows they occur in.
+    '''
+    column_codes = []
+    column_traits = []
+    keys = np.zeros(len(frame), dtype=np.int64)
+    missing = np.zeros(len(frame), dtype=bool)
+    for col_name in frame.columns:
+        codes, traits = _factorize(frame[col_name])
+        column_codes.append(codes)
+        column_traits.append(traits)
+        keys = keys * len(traits) + codes
+        missing |= np.asarray(codes) < 0
+
+    codes = np.full(len(frame), -1, dtype=np.intp)
+    codes[~missing], cell_keys = pd.factorize(keys[~missing], sort=True)
+    # split each combination's key back into the code of every column
+    levels = []
+    for traits in reversed(column_traits):
+        cell_keys, trait_codes = np.divmod(cell_keys, len(traits))
+        levels.insert(0, np.asarray(traits)[trait_codes])
+    return codes, pd.MultiIndex.from_arrays(levels, names=list(frame.columns))
@@ -1,47 +1,33 @@
 import cmd
 import sys
 import os
-import csv
 
-class CSVReaderConst(object):
-    HIGHEST_RISK = 10
-    LOWEST_RISK = 1
-    RACES_TO_CORRECT = ["African American", "White"]
-    RECIDIVISM_COL_NAME = "two_year_recid"
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from analysis_core import CSVReaderConst, AnalysisSession
 
 class CSVReader(object):
     '''
-    Class to read in CSV file object, and calculate different factors about it.
+    Class to read in CSV file object, and calculate different factors about it. Kept for its original
+    interface, the counting and correcting is done by the shared AnalysisSession of analysis_core.py.
     '''
     def __init__(self, csv_path):
         self.csv_path = csv_path
-        self.csv_list = [];
+        self.session = None
 
     def read_file(self):
-        '''Reads everything from file into csv_list'''
-        with open(self.csv_path) as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                self.csv_list.append(row)
+        '''Loads the file into an AnalysisSession'''
+        self.session = AnalysisSession(self.csv_path)
 
     def trait_breakdown(self, col_name, to_print=False):
         '''Find each trait and the percentage it is of a particular column. Print results, and return dict.'''
-        total_def_rows = 0
-        trait_dict = {}
+        trait_counts = self.session.trait_counts(col_name)
+        total_def_rows = trait_counts.sum()
         trait_percentage_dict = {}
-        for row_dict in self.csv_list:
-            if row_dict.get(col_name, None):
-                trait = row_dict[col_name]
-                if trait in trait_dict:
-                    trait_dict[trait] += 1
-                else:
-                    trait_dict[trait] = 1
-                total_def_rows += 1
 
         if to_print is True:
             print("In column {0!s}, {1!s} total defined rows were found".format(col_name, total_def_rows))
 
-        for trait, num_def_rows in trait_dict.items():
+        for trait, num_def_rows in trait_counts.items():
             abundance = num_def_rows/float(total_def_rows)
             trait_percentage_dict[trait] = abundance
             if to_print is True:
@@ -51,14 +37,10 @@ class CSVReader(object):
 
     def rows_with(self, col_name, traits):
         '''Find all rows with particular property. Return list of rows.'''
+        trait_rows = self.session.trait_rows(col_name)
         ret_dict = {}
         for trait in traits:
-            ret_dict[trait] = []
-        for row_dict in self.csv_list:
-            if row_dict.get(col_name, None) in traits:
-                ret_dict[row_dict[col_name]].append(row_dict)
-
-        # print(ret_dict)
+            ret_dict[trait] = self.session.df.iloc[trait_rows.rows(trait)].to_dict("records")
         return ret_dict
 
     def correct_for(self, col_name, recid_dec_col_name, traits=[]):
@@ -66,59 +48,32 @@ class CSVReader(object):
         Across same col_name, correct the attribute for each trait to remove bias
         '''
         if traits == []:
-            trait_percentage_dict = self.trait_breakdown(col_name=col_name)
-            for trait, percentage in trait_percentage_dict.items():
-                traits.append(trait)
+            traits = list(self.trait_breakdown(col_name=col_name))
 
-        rows_by_trait = self.rows_with(col_name=col_name, traits=traits)
+        stats = self.session.error_stats(col_name, recid_dec_col_name, traits)
+        members = stats.members()
+        total_abs_error, bias = stats.total_abs_error(), stats.bias()
+        new_total_abs_error, new_bias = stats.total_abs_error(corrected=True), stats.bias(corrected=True)
+        trait_pos = [stats.groups.get_loc(trait) for trait in traits]
         baseline_error_dict = {}
         baseline_bias_dict = {}
-        for trait, group in rows_by_trait.items():
-            num_members = len(group)
-            total_abs_error = 0
-            total_error = 0
-            for person in group:
-                if int(person[CSVReaderConst.RECIDIVISM_COL_NAME]) == 1:
-                    person_error = float(person[recid_dec_col_name]) - CSVReaderConst.HIGHEST_RISK
-                else:
-                    person_error = float(person[recid_dec_col_name]) - CSVReaderConst.LOWEST_RISK
-                total_error += person_error
-                total_abs_error += abs(person_error)
-            if num_members == 0:
+        for trait, pos in zip(traits, trait_pos):
+            if members[pos] == 0:
                 raise ValueError("No members found in group {0!s}".format(trait))
-            baseline_bias = total_error/float(num_members)
             # if mostly over-predicted, baseline bias positive. if under, negative.
-            baseline_bias_dict[trait] = baseline_bias
-            baseline_error_dict[trait] = total_abs_error
-            # print(total_error)
+            baseline_bias_dict[trait] = bias[pos]
+            baseline_error_dict[trait] = total_abs_error[pos]
             print("For group {0!s}, baseline error: {1:.3f}, baseline bias: {2:.3f}".format(trait,
-                                                                                            total_abs_error,
-                                                                                            baseline_bias))
+                                                                                            total_abs_error[pos],
+                                                                                            bias[pos]))
 
-        alt_rows_by_trait = rows_by_trait
+        # compensate for bias of each group, subtracted per person
         new_error_dict = {}
-        new_baseline_dict = {}
-        for trait, group in alt_rows_by_trait.items():
-            num_members = len(group)
-            new_total_error = 0
-            total_abs_error = 0
-            for person in group:
-                # compensate for bias of this group, subtract per person
-                corrected_decile = float(person[recid_dec_col_name]) - float(baseline_bias_dict[trait])
-                if int(person[CSVReaderConst.RECIDIVISM_COL_NAME]) == 1:
-                    person_error = float(corrected_decile) - CSVReaderConst.HIGHEST_RISK
-                else:
-                    person_error = float(corrected_decile) - CSVReaderConst.LOWEST_RISK
-                new_total_error += person_error
-                total_abs_error += abs(person_error)
-            if num_members == 0:
-                raise ValueError("No members found in group {0!s}".format(trait))
-            new_baseline_bias = new_total_error/float(num_members)
-            new_error_dict[trait] = total_abs_error
-            new_baseline_dict[trait] = new_baseline_bias
+        for trait, pos in zip(traits, trait_pos):
+            new_error_dict[trait] = new_total_abs_error[pos]
             print("For group {0!s}, corrected error: {1:.3f}, corrected bias: {2:.3f}".format(trait,
-                                                                                              total_abs_error,
-                                                                                              new_baseline_bias))
+                                                                                              new_total_abs_error[pos],
+                                                                                              new_bias[pos]))
 
         return baseline_error_dict, baseline_bias_dict, new_error_dict
 
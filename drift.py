@@ -0,0 +1,147 @@
+'''
+Tracks how the bias correct_for finds, and the error of the best threshold, drift over time.
+
+Each trait's baseline bias, absolute error, corrected error and lowest threshold error are computed over
+rolling windows of a date column, i.e. 90 day windows of screening_date starting every month. Rows are
+sorted by date once, then a sweep keeps a running histogram of (trait, score, recidivism) counts: each
+window adds the rows that entered since the last window and removes those that left, so every row is
+added and removed once, instead of each window being recomputed from its rows. The metrics of all
+windows then follow from their histograms together.
+
+i.e. python drift.py ./compas-analysis/compas-scores-two-years.csv race decile_score ./drift
+     python drift.py scores.csv race decile_score ./drift --date-col c_jail_in --window 180 --step QS
+
+writes drift.csv and a plot of bias per trait over time to ./drift
+'''
+import os
+import sys
+import argparse
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+import pandas as pd
+
+from dataset import load_dataset
+from analysis_core import CSVReaderConst, cell_error_stats, sweep_thresholds
+from plot_renderer import FigureRenderer
+
+DEFAULT_DATE_COL = "screening_date"
+DEFAULT_WINDOW_DAYS = 90
+# pandas offset alias of how often a window starts, month starts by default
+DEFAULT_STEP = "MS"
+
+
+def window_histograms(dates, trait_codes, num_traits, scores, recid, window_starts, window_days):
+    '''
+    Returns the score values and, for each window, the number of people per trait and score without and
+    with recidivism, as an array of shape (windows, traits, scores, 2). Rows with a trait code of -1 or a
+    missing date or score are left out.
+    '''
+    keep = (trait_codes >= 0) & ~np.isnat(dates) & ~np.isnan(scores)
+    order = np.argsort(dates[keep], kind="stable")
+    dates = dates[keep][order]
+    score_codes, score_values = pd.factorize(scores[keep][order], sort=True)
+    num_cells = num_traits * len(score_values) * 2
+    cells = (trait_codes[keep][order] * len(score_values) + score_codes) * 2 + recid[keep][order]
+
+    window_starts = np.asarray(window_starts, dtype="datetime64[ns]")
+    first = np.searchsorted(dates, window_starts, side="left")
+    last = np.searchsorted(dates, window_starts + np.timedelta64(window_days, "D"), side="left")
+    running = np.zeros(num_cells, dtype=np.int64)
+    histograms = np.zeros((len(window_starts), num_cells), dtype=np.int64)
+    added = removed = 0
+    for window, (start, end) in enumerate(zip(first, last)):
+        # rows that entered the window since the last one, then rows that left it
+        if end > added:
+            running += np.bincount(cells[added:end], minlength=num_cells)
+            added = end
+        if start > removed:
+            running -= np.bincount(cells[removed:start], minlength=num_cells)
+            removed = start
+        histograms[window] = running
+    return np.asarray(score_values), histograms.reshape(len(window_starts), num_traits, len(score_values), 2)
+
+
+def window_drift(df, col_name, recid_dec_col_name, date_col=DEFAULT_DATE_COL, window_days=DEFAULT_WINDOW_DAYS,
+                 step=DEFAULT_STEP, thresholds=range(1, 10)):
+    '''
+    Returns a frame indexed by (window_start, trait) with the members, baseline bias and absolute error,
+    corrected absolute error, and lowest error threshold and its error, of each trait with members in
+    each window. Windows start every step from the start of the first date's step.
+    '''
+    dates = pd.to_datetime(df[date_col], errors="coerce").values
+    trait_counts = df[col_name].value_counts(sort=True, ascending=False)
+    traits = trait_counts.index[trait_counts.values > 0]
+    trait_codes = traits.get_indexer(df[col_name])
+    scores = df[recid_dec_col_name].values.astype(float)
+    recid = (df[CSVReaderConst.RECIDIVISM_COL_NAME].values == 1).astype(np.int64)
+    valid_dates = dates[~np.isnat(dates)]
+    if len(valid_dates) == 0:
+        raise ValueError("No dates found in {0!s}".format(date_col))
+    first_start = pd.tseries.frequencies.to_offset(step).rollback(pd.Timestamp(valid_dates.min()).normalize())
+    window_starts = pd.date_range(first_start, pd.Timestamp(valid_dates.max()), freq=step)
+    score_values, histograms = window_histograms(dates, trait_codes, len(traits), scores, recid, window_starts,
+                                                 window_days)
+    non_recid_hist, recid_hist = histograms[..., 0], histograms[..., 1]
+    # every (window, trait) is a group of its own
+    num_groups = histograms.shape[0] * histograms.shape[1]
+    stats = cell_error_stats(score_values, recid_hist, non_recid_hist, groups=np.arange(num_groups))
+    thresholds = sorted(thresholds)
+    false_pos, false_neg = sweep_thresholds(score_values, recid_hist.reshape(num_groups, -1),
+                                            non_recid_hist.reshape(num_groups, -1), thresholds)
+    errors = false_pos + false_neg
+    lowest_error = np.argmin(errors, axis=1)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        drift = pd.DataFrame({"members": stats.members(),
+                              "baseline_bias": stats.bias(),
+                              "baseline_error": stats.abs_error(),
+                              "new_error": stats.abs_error(corrected=True),
+                              "best_threshold": np.asarray(thresholds)[lowest_error],
+                              "threshold_error": errors[np.arange(num_groups), lowest_error]},
+                             index=pd.MultiIndex.from_product([window_starts, traits], names=["window_start", col_name]),
+                             columns=["members", "baseline_bias", "baseline_error", "new_error", "best_threshold",
+                                      "threshold_error"])
+    return drift[drift["members"] > 0]
+
+
+def draw_drift(fig, drift, title):
+    ax = fig.add_subplot(111)
+    for trait, trait_drift in drift["baseline_bias"].groupby(level=1, sort=False, observed=True):
+        ax.plot(trait_drift.index.get_level_values(0), trait_drift.values, marker="o", label="{0!s}".format(trait))
+    ax.axhline(0, color="gray", linewidth=1)
+    ax.set_xlabel("Window Start")
+    ax.set_ylabel("Baseline Bias")
+    ax.legend()
+    ax.set_title(title)
+    fig.autofmt_xdate()
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Track per trait bias and threshold error over rolling date windows")
+    parser.add_argument("filepath", help="CSV file to analyze")
+    parser.add_argument("col_name", help="column to group by, i.e. race")
+    parser.add_argument("recid_dec_col_name", help="score column, i.e. decile_score")
+    parser.add_argument("output_dir", help="directory to write drift.csv and the plot to")
+    parser.add_argument("--date-col", default=DEFAULT_DATE_COL, help="date column the windows are over")
+    parser.add_argument("--window", type=int, default=DEFAULT_WINDOW_DAYS, help="days in each window")
+    parser.add_argument("--step", default=DEFAULT_STEP, help="pandas frequency windows start at, i.e. MS or QS")
+    args = parser.parse_args(argv[1:])
+
+    df = load_dataset(args.filepath, columns=[args.col_name, args.recid_dec_col_name,
+                                              CSVReaderConst.RECIDIVISM_COL_NAME, args.date_col])
+    drift = window_drift(df, args.col_name, args.recid_dec_col_name, date_col=args.date_col,
+                         window_days=args.window, step=args.step)
+    if not os.path.isdir(args.output_dir):
+        os.makedirs(args.output_dir)
+    drift.to_csv(os.path.join(args.output_dir, "drift.csv"))
+    title = "Baseline Bias by {0!s}, {1!s} Day Windows of {2!s}".format(args.col_name.capitalize(), args.window,
+                                                                        args.date_col)
+    renderer = FigureRenderer(args.output_dir, background=False)
+    renderer.submit("drift_{0!s}_{1!s}".format(args.col_name, args.recid_dec_col_name), draw_drift, drift, title)
+    print(drift)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,161 @@
+'''
+Error models for scoring how well the risk scores fit each group, beyond the one correct_for uses.
+
+A model is an outcome column, i.e. two_year_recid or is_violent_recid, a target mapping from the outcome
+to the score we would expect, and a loss over each person's error, their score minus their target:
+    linear    mean absolute error
+    rms       root mean squared error
+    huber     mean Huber loss, squared for errors up to delta and linear beyond
+    log_loss  mean log-loss of the probability of the outcome at each score, calibrated as the smoothed
+              rate of the outcome at that score over everyone. Targets aren't used.
+Each model is scored per group at baseline and corrected, where corrected is as in correct_for, each
+group's scores shifted by its bias, or for log_loss, the probabilities calibrated on the group alone.
+
+Losses are numpy kernels over arrays of scores and outcomes, evaluated on the score histograms of
+AnalysisSession.outcome_histograms, in which everyone with the same score and outcome is counted once.
+The histograms of every outcome column are built in one pass, so any number of models cost one read
+of the data, and are cached with the session's other results.
+
+Models are given as loss[(delta=D)][:outcome_col][@positive/negative], comma separated, where delta is
+the Huber delta, and positive and negative the targets of those with and without the outcome, HIGHEST_RISK
+and LOWEST_RISK by default, i.e. linear,huber,log_loss:is_violent_recid or huber(delta=2):is_violent_recid@8/2
+'''
+import re
+import numpy as np
+import pandas as pd
+
+from analysis_core import CSVReaderConst, cell_error_stats
+
+LOSSES = ["linear", "rms", "huber", "log_loss"]
+DEFAULT_MODELS = "linear,rms,huber,log_loss"
+DEFAULT_HUBER_DELTA = 1.0
+# added to the count of each outcome at a score when calibrating, so no probability is 0 or 1
+CALIBRATION_PRIOR = 0.5
+METRICS = ["members", "bias", "loss", "new_bias", "new_loss"]
+# loss, huber delta, outcome column, positive target, negative target
+MODEL_SPEC = re.compile(r"^(\w+)(?:\(delta=([^)]*)\))?(?::([^@]+))?(?:@([^/]*)/(.*))?$")
+
+
+class ErrorModel(object):
+    def __init__(self, loss="linear", outcome_col=CSVReaderConst.RECIDIVISM_COL_NAME,
+                 positive_target=CSVReaderConst.HIGHEST_RISK, negative_target=CSVReaderConst.LOWEST_RISK,
+                 huber_delta=DEFAULT_HUBER_DELTA):
+        '''
+        Scores the loss of the errors against outcome_col, where the target is positive_target for those
+        with the outcome and negative_target for the rest
+        '''
+        if loss not in LOSSES:
+            raise ValueError("Unknown loss {0!s}, use one of {1!s}".format(loss, LOSSES))
+        if huber_delta <= 0:
+            raise ValueError("Huber delta must be positive, not {0!s}".format(huber_delta))
+        self.loss = loss
+        self.outcome_col = outcome_col
+        self.positive_target = positive_target
+        self.negative_target = negative_target
+        self.huber_delta = huber_delta
+        # the spec of the model, leaving out what is the default
+        self.name = loss
+        if huber_delta != DEFAULT_HUBER_DELTA:
+            self.name += "(delta={0:g})".format(huber_delta)
+        if outcome_col != CSVReaderConst.RECIDIVISM_COL_NAME:
+            self.name += ":{0!s}".format(outcome_col)
+        if (positive_target, negative_target) != (CSVReaderConst.HIGHEST_RISK, CSVReaderConst.LOWEST_RISK):
+            self.name += "@{0:g}/{1:g}".format(positive_target, negative_target)
+
+    def kernel(self, errors):
+        '''
+        Loss of each error, averaged over each group, and for rms, square rooted after
+        '''
+        if self.loss == "linear":
+            return np.abs(errors)
+        if self.loss == "rms":
+            return np.square(errors)
+        if self.loss == "huber":
+            abs_errors = np.abs(errors)
+            return np.where(abs_errors <= self.huber_delta, 0.5 * np.square(errors),
+                            self.huber_delta * (abs_errors - 0.5 * self.huber_delta))
+        raise ValueError("log_loss is on probabilities, not errors")
+
+    def evaluate(self, trait_index, score_values, positive_hist, negative_hist):
+        '''
+        Frame of METRICS per trait
+        '''
+        members = positive_hist.sum(axis=1) + negative_hist.sum(axis=1)
+        if self.loss == "log_loss":
+            bias, loss, new_bias, new_loss = _log_loss(score_values, positive_hist, negative_hist)
+        else:
+            stats = cell_error_stats(score_values, positive_hist, negative_hist, groups=trait_index,
+                                     targets=(self.positive_target, self.negative_target))
+            bias, new_bias = stats.bias(), stats.bias(corrected=True)
+            loss, new_loss = stats.mean_loss(self.kernel), stats.mean_loss(self.kernel, corrected=True)
+            if self.loss == "rms":
+                loss, new_loss = np.sqrt(loss), np.sqrt(new_loss)
+        return pd.DataFrame({"members": members, "bias": bias, "loss": loss, "new_bias": new_bias, "new_loss": new_loss},
+                            index=trait_index, columns=METRICS)
+
+
+def _calibrate(positive_hist, negative_hist):
+    # smoothed rate of the outcome at each score
+    return (positive_hist + CALIBRATION_PRIOR) / (positive_hist + negative_hist + 2 * CALIBRATION_PRIOR).astype(float)
+
+
+def _log_loss(score_values, positive_hist, negative_hist):
+    '''
+    Bias (mean probability minus the rate of the outcome) and mean log-loss per trait, with probabilities
+    calibrated over everyone, then calibrated on each trait alone
+    '''
+    members = (positive_hist.sum(axis=1) + negative_hist.sum(axis=1)).astype(float)
+    results = []
+    for probabilities in [_calibrate(positive_hist.sum(axis=0), negative_hist.sum(axis=0))[np.newaxis, :],
+                          _calibrate(positive_hist, negative_hist)]:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            bias = ((positive_hist + negative_hist) * probabilities - positive_hist).sum(axis=1) / members
+            loss = -(positive_hist * np.log(probabilities) + negative_hist * np.log(1 - probabilities)).sum(axis=1) / members
+        results += [bias, loss]
+    return results
+
+
+def parse_models(spec):
+    '''
+    ErrorModels of a spec like linear,huber,log_loss:is_violent_recid or huber(delta=2):is_violent_recid@8/2
+    '''
+    models = []
+    for model_spec in spec.split(","):
+        match = MODEL_SPEC.match(model_spec.strip())
+        if match is None:
+            raise ValueError("Models are given as loss[(delta=D)][:outcome_col][@positive/negative], "
+                             "not {0!s}".format(model_spec))
+        loss, huber_delta, outcome_col, positive_target, negative_target = match.groups()
+        if huber_delta is not None and loss != "huber":
+            raise ValueError("Only huber takes a delta, not {0!s}".format(model_spec))
+        if positive_target is not None and loss == "log_loss":
+            raise ValueError("log_loss doesn't use targets, not {0!s}".format(model_spec))
+        try:
+            models.append(ErrorModel(loss=loss, outcome_col=outcome_col or CSVReaderConst.RECIDIVISM_COL_NAME,
+                                     positive_target=CSVReaderConst.HIGHEST_RISK if positive_target is None else
+                                     float(positive_target),
+                                     negative_target=CSVReaderConst.LOWEST_RISK if negative_target is None else
+                                     float(negative_target),
+                                     huber_delta=DEFAULT_HUBER_DELTA if huber_delta is None else float(huber_delta)))
+        except ValueError as e:
+            raise ValueError("Bad model {0!s}: {1!s}".format(model_spec, e))
+    return models
+
+
+def is_model_spec(arg):
+    '''
+    Whether arg is a spec of models, rather than the start of some other argument
+    '''
+    match = MODEL_SPEC.match(arg.split(",")[0])
+    return match is not None and match.group(1) in LOSSES
+
+
+def evaluate_models(models, histograms):
+    '''
+    Frame of METRICS per (model, trait), from the outcome_histograms of an AnalysisSession
+    '''
+    frames = []
+    for model in models:
+        positive_hist, negative_hist = histograms["histograms"][model.outcome_col]
+        frames.append(model.evaluate(histograms["trait_index"], histograms["score_values"], positive_hist, negative_hist))
+    return pd.concat(frames, keys=[model.name for model in models], names=["model"])
@@ -0,0 +1,236 @@
+'''
+Keeps the bias correction results of a CSV up to date as new cases are appended to it, without reloading it.
+
+The sufficient statistics of correct_for are the number of people with and without recidivism per
+(trait, decile) cell. They are saved to a state file along with how far into the CSV they go, and each
+update only reads what was added since:
+    - by default, the rows after the byte offset the last update stopped at, read in chunks. A last line
+      without a newline yet is left for the next update. If the CSV shrank or its header changed, it was
+      rewritten rather than appended to, and the statistics are rebuilt from scratch.
+    - with a watermark column, i.e. screening_date, the rows whose value is above the highest value seen
+      so far, for exports that are rewritten in full but only ever gain rows at or after it. Rows at the
+      highest value are counted too, past as many as the last update counted, so cases of the same day
+      added after an update aren't lost.
+Baseline and corrected metrics follow from the cell counts alone, so an update costs the new rows plus
+a few milliseconds, however long the history is.
+
+i.e. python incremental.py ./compas-analysis/compas-scores-two-years.csv race decile_score ./race_state.json
+     python incremental.py scores.csv race decile_score ./race_state.json --watermark screening_date
+'''
+import io
+import os
+import sys
+import json
+import argparse
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+import pandas as pd
+
+from bias_stats import bias_table
+from csv_stream import DEFAULT_CHUNKSIZE, read_csv_chunks
+from analysis_core import CSVReaderConst, cell_error_stats
+
+STATE_VERSION = 2
+
+
+class IncrementalStats(object):
+    def __init__(self, col_name, recid_dec_col_name, watermark_col=None):
+        '''
+        Empty statistics of traits in col_name by score in recid_dec_col_name, updated by byte offset, or by
+        watermark_col if given
+        '''
+        self.col_name = col_name
+        self.recid_dec_col_name = recid_dec_col_name
+        self.watermark_col = watermark_col
+        self.reset()
+
+    def reset(self):
+        self.offset = 0
+        self.header = None
+        self.watermark = None
+        # rows counted so far whose watermark_col is the watermark
+        self.watermark_rows = 0
+        self.rows = 0
+        # rows are (trait, decile) cells, columns are the counts without and with recidivism
+        self.counts = pd.DataFrame({"non_recid": [], "recid": []}, dtype=np.int64,
+                                   index=pd.MultiIndex.from_tuples([], names=[self.col_name, self.recid_dec_col_name]))
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            state = json.load(f)
+        if state.get("version") != STATE_VERSION:
+            raise ValueError("State file {0!s} is from another version, delete it to rebuild".format(path))
+        stats = cls(state["col_name"], state["recid_dec_col_name"], state["watermark_col"])
+        stats.offset, stats.header = state["offset"], state["header"]
+        stats.watermark, stats.watermark_rows, stats.rows = state["watermark"], state["watermark_rows"], state["rows"]
+        cells = state["cells"]
+        stats.counts = pd.DataFrame({"non_recid": cells["non_recid"], "recid": cells["recid"]}, dtype=np.int64,
+                                    index=pd.MultiIndex.from_arrays([cells["traits"], cells["deciles"]],
+                                                                    names=[stats.col_name, stats.recid_dec_col_name]))
+        return stats
+
+    def save(self, path):
+        state = {"version": STATE_VERSION,
+                 "col_name": self.col_name,
+                 "recid_dec_col_name": self.recid_dec_col_name,
+                 "watermark_col": self.watermark_col,
+                 "offset": self.offset,
+                 "header": self.header,
+                 "watermark": self.watermark,
+                 "watermark_rows": self.watermark_rows,
+                 "rows": self.rows,
+                 "cells": {"traits": [_to_json(trait) for trait in self.counts.index.get_level_values(0)],
+                           "deciles": [_to_json(decile) for decile in self.counts.index.get_level_values(1)],
+                           "non_recid": [int(count) for count in self.counts["non_recid"]],
+                           "recid": [int(count) for count in self.counts["recid"]]}}
+        with open(path + ".tmp", "w") as f:
+            json.dump(state, f)
+        os.rename(path + ".tmp", path)
+
+    def add(self, frame):
+        '''
+        Folds the rows of frame into the counts. Rows missing the trait or score are left out.
+        '''
+        recid = (frame[CSVReaderConst.RECIDIVISM_COL_NAME] == 1).map({False: "non_recid", True: "recid"})
+        cell_counts = pd.crosstab([frame[self.col_name], frame[self.recid_dec_col_name]], recid)
+        cell_counts = cell_counts.reindex(columns=["non_recid", "recid"], fill_value=0)
+        cell_counts.index.names = [self.col_name, self.recid_dec_col_name]
+        self.counts = self.counts.add(cell_counts, fill_value=0).astype(np.int64)
+        self.rows += len(frame)
+
+    def update(self, filepath, chunksize=DEFAULT_CHUNKSIZE):
+        '''
+        Folds in the rows added to filepath since the last update. Returns the number of rows added.
+        '''
+        rows_before = self.rows
+        if self.watermark_col is None:
+            self._update_from_offset(filepath, chunksize)
+        else:
+            self._update_from_watermark(filepath, chunksize)
+        return self.rows - rows_before
+
+    def _columns(self):
+        return [self.col_name, self.recid_dec_col_name, CSVReaderConst.RECIDIVISM_COL_NAME]
+
+    def _update_from_offset(self, filepath, chunksize):
+        with open(filepath, "rb") as f:
+            header = f.readline()
+            if self.header is not None and (header.decode("utf-8") != self.header or
+                                            os.path.getsize(filepath) < self.offset):
+                print("{0!s} was rewritten, not appended to, rebuilding".format(filepath))
+                self.reset()
+            self.header = header.decode("utf-8")
+            start = max(self.offset, len(header))
+            # a last line without a newline may still be being written, so rows are read up to the last newline
+            end = _last_line_end(f, start, os.fstat(f.fileno()).st_size)
+            if end > start:
+                header_columns = list(pd.read_csv(io.BytesIO(header), nrows=0).columns)
+                f.seek(start)
+                # streamed a chunk at a time, the rows added are never all held at once
+                added = io.BufferedReader(_BoundedReader(f, end - start))
+                for chunk in pd.read_csv(added, header=None, names=header_columns, usecols=self._columns(),
+                                         chunksize=chunksize):
+                    self.add(chunk)
+        self.offset = end
+
+    def _update_from_watermark(self, filepath, chunksize):
+        watermark, watermark_rows = self.watermark, self.watermark_rows
+        # rows at the old watermark read so far, the first self.watermark_rows of them are already counted
+        at_old_watermark = 0
+        for chunk in read_csv_chunks(filepath, self._columns() + [self.watermark_col], chunksize):
+            if self.watermark is not None:
+                values = chunk[self.watermark_col]
+                at_watermark = (values == self.watermark).values
+                seen_before = at_old_watermark + np.cumsum(at_watermark) <= self.watermark_rows
+                at_old_watermark += at_watermark.sum()
+                chunk = chunk[(values > self.watermark).values | (at_watermark & ~seen_before)]
+            if len(chunk):
+                self.add(chunk)
+                chunk_watermark = _to_json(chunk[self.watermark_col].max())
+                chunk_watermark_rows = int((chunk[self.watermark_col] == chunk_watermark).sum())
+                if watermark is None or chunk_watermark > watermark:
+                    watermark, watermark_rows = chunk_watermark, chunk_watermark_rows
+                elif chunk_watermark == watermark:
+                    watermark_rows += chunk_watermark_rows
+        self.watermark, self.watermark_rows = watermark, watermark_rows
+
+    def error_stats(self):
+        '''
+        ErrorStats per trait from the cell counts, the same as correct_for would build from every row
+        '''
+        traits = self.counts.index.get_level_values(0)
+        groups = pd.Index(traits.unique())
+        # (trait, decile) count arrays, with no one in the cells no row has landed in yet
+        recid = self.counts["recid"].unstack(fill_value=0).reindex(groups)
+        non_recid = self.counts["non_recid"].unstack(fill_value=0).reindex(groups)
+        return cell_error_stats(recid.columns.values.astype(float), recid.values.astype(np.int64),
+                                non_recid.values.astype(np.int64), groups=groups)
+
+
+class _BoundedReader(io.RawIOBase):
+    '''
+    Reads at most size bytes of f from where it is, for pandas to parse the complete lines of a CSV only
+    '''
+    def __init__(self, f, size):
+        self.f = f
+        self.remaining = size
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.f.read(min(len(buffer), self.remaining))
+        buffer[:len(data)] = data
+        self.remaining -= len(data)
+        return len(data)
+
+
+def _last_line_end(f, start, size, block_bytes=1 << 16):
+    '''
+    Position just after the last newline of f at or after start, or start if there is none
+    '''
+    end = size
+    while end > start:
+        block_start = max(start, end - block_bytes)
+        f.seek(block_start)
+        newline = f.read(end - block_start).rfind(b"\n")
+        if newline >= 0:
+            return block_start + newline + 1
+        end = block_start
+    return start
+
+
+def _to_json(value):
+    # numpy scalars, i.e. from pandas columns, aren't JSON serializable
+    return value.item() if hasattr(value, "item") else value
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Fold rows appended to a CSV into saved bias statistics")
+    parser.add_argument("filepath", help="CSV that new cases are appended to")
+    parser.add_argument("col_name", help="column to group by, i.e. race")
+    parser.add_argument("recid_dec_col_name", help="score column, i.e. decile_score")
+    parser.add_argument("state", help="file the statistics are kept in, created by the first update")
+    parser.add_argument("--watermark", default=None,
+                        help="column whose value in new rows is never below that of earlier rows, i.e. a date, to use instead of the byte offset")
+    args = parser.parse_args(argv[1:])
+
+    if os.path.isfile(args.state):
+        stats = IncrementalStats.load(args.state)
+        if (stats.col_name, stats.recid_dec_col_name, stats.watermark_col) != \
+                (args.col_name, args.recid_dec_col_name, args.watermark):
+            print("{0!s} holds statistics of other columns".format(args.state))
+            return 1
+    else:
+        stats = IncrementalStats(args.col_name, args.recid_dec_col_name, watermark_col=args.watermark)
+    added = stats.update(args.filepath)
+    stats.save(args.state)
+    print("Added {0!s} rows, {1!s} in total".format(added, stats.rows))
+    print(bias_table(stats.error_stats()))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,151 @@
+'''
+Memory-mapped binary copy of the columns the analyzers use, for sharing one dataset between processes.
+
+Each column is written once as a flat binary file of its compact values, the codes of categoricals like
+race (int8), and integer columns like decile_score and two_year_recid downcast (int8), along with a small
+dictionary.json of each column's dtype and category labels. Opening a column maps its file with np.memmap
+and wraps it in a frame without copying, so opening is near-instant whatever the size, and any number of
+processes opening the same columns share one copy in the page cache instead of each holding their own.
+
+The files live in an "mmap" directory inside the CSV's columnar cache, and are written the first time a
+column is asked for. Each file is named after its column, and processes writing columns at once take
+turns updating the dictionary under a file lock, so none maps another's codes or drops its columns. They
+go with the cache whenever it is rebuilt for a changed CSV. The frames are read only, the analyzers never
+change the data they load.
+
+i.e. python mmap_dataset.py ./compas-analysis/compas-scores-two-years.csv race,sex,decile_score,two_year_recid
+writes those columns ahead of time, so the first analysis doesn't have to.
+'''
+import os
+import sys
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+
+from csv_cache import file_lock, fresh_cache
+from dataset import load_dataset
+
+MMAP_DIR = "mmap"
+DICTIONARY_FILE = "dictionary.json"
+LOCK_FILE = "dictionary.lock"
+MMAP_VERSION = 1
+# dtype kinds stored as they are, anything else, i.e. strings, is stored as category codes
+RAW_KINDS = "biufM"
+
+
+def _read_dictionary(mmap_dir):
+    try:
+        with open(os.path.join(mmap_dir, DICTIONARY_FILE)) as f:
+            dictionary = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+    if dictionary.get("version") != MMAP_VERSION:
+        return None
+    return dictionary
+
+
+def _write_dictionary(mmap_dir, dictionary):
+    path = os.path.join(mmap_dir, DICTIONARY_FILE)
+    with open(path + ".{0!s}.tmp".format(os.getpid()), "w") as f:
+        json.dump(dictionary, f)
+    os.rename(path + ".{0!s}.tmp".format(os.getpid()), path)
+
+
+def _locked(mmap_dir):
+    '''
+    Holds the lock of the mmap directory, so one process at a time reads, updates and writes its dictionary.
+    Without file locks, i.e. on Windows, processes writing columns at once may drop each other's from the
+    dictionary, and write them again the next time they are asked for.
+    '''
+    return file_lock(os.path.join(mmap_dir, LOCK_FILE))
+
+
+def _column_file(col_name):
+    # named after the column rather than numbered, so two processes never write the same file for different columns
+    return "col_{0!s}.bin".format(hashlib.sha1(col_name.encode("utf-8")).hexdigest()[:16])
+
+
+def write_columns(filepath, columns):
+    '''
+    Writes the given columns of a CSV to its mmap directory, after any already there. Returns the directory.
+    '''
+    cache_dir, _ = fresh_cache(filepath)
+    mmap_dir = os.path.join(cache_dir, MMAP_DIR)
+    if not os.path.isdir(mmap_dir):
+        os.makedirs(mmap_dir, exist_ok=True)
+    df = load_dataset(filepath, columns=columns)
+    with _locked(mmap_dir):
+        dictionary = _read_dictionary(mmap_dir)
+        if dictionary is None or dictionary["rows"] != len(df):
+            dictionary = {"version": MMAP_VERSION, "rows": len(df), "columns": {}}
+
+        for col_name in columns:
+            column = df[col_name]
+            labels = None
+            if isinstance(column.dtype, pd.CategoricalDtype):
+                values, labels = column.cat.codes.values, column.cat.categories
+            elif column.dtype.kind in RAW_KINDS:
+                values = column.values
+            else:
+                codes, labels = pd.factorize(column)
+                values = codes.astype(np.int8 if len(labels) < np.iinfo(np.int8).max else np.int32)
+            filename = _column_file(col_name)
+            path = os.path.join(mmap_dir, filename)
+            np.ascontiguousarray(values).tofile(path + ".{0!s}.tmp".format(os.getpid()))
+            os.rename(path + ".{0!s}.tmp".format(os.getpid()), path)
+            dictionary["columns"][col_name] = {"file": filename,
+                                               "dtype": values.dtype.str,
+                                               "labels": None if labels is None else labels.tolist()}
+        _write_dictionary(mmap_dir, dictionary)
+    return mmap_dir
+
+
+def load_mmap_dataset(filepath, columns=None):
+    '''
+    Drop-in for dataset.load_dataset that maps the given columns (all by default) of a CSV from its mmap
+    directory, writing any not there yet first. Categorical and other string columns come back as
+    categoricals over the mapped codes, and all columns are read only.
+    '''
+    cache_dir, csv_columns = fresh_cache(filepath)
+    if columns is None:
+        columns = csv_columns
+    missing = [col_name for col_name in columns if col_name not in csv_columns]
+    if missing:
+        raise KeyError("Columns not found in CSV: {0!s}".format(missing))
+
+    mmap_dir = os.path.join(cache_dir, MMAP_DIR)
+    dictionary = _read_dictionary(mmap_dir)
+    unwritten = [col_name for col_name in columns if dictionary is None or col_name not in dictionary["columns"]]
+    if unwritten:
+        write_columns(filepath, unwritten)
+        dictionary = _read_dictionary(mmap_dir)
+
+    data = {}
+    for col_name in columns:
+        entry = dictionary["columns"][col_name]
+        if dictionary["rows"] == 0:
+            # empty files can't be mapped
+            values = np.zeros(0, dtype=np.dtype(entry["dtype"]))
+        else:
+            # a plain ndarray view, so results computed from it aren't memmaps too
+            values = np.memmap(os.path.join(mmap_dir, entry["file"]), dtype=np.dtype(entry["dtype"]), mode="r",
+                               shape=(dictionary["rows"],)).view(np.ndarray)
+        if entry["labels"] is not None:
+            values = pd.Categorical.from_codes(values, categories=pd.Index(entry["labels"]))
+        data[col_name] = values
+    # copy=False keeps every column on its mapped file, instead of consolidating them onto the heap
+    return pd.DataFrame(data, columns=list(columns), copy=False)
+
+
+def main(argv):
+    if len(argv) < 3:
+        print("Need filepath and comma separated columns")
+        return 1
+    mmap_dir = write_columns(os.path.normpath(argv[1]), argv[2].split(","))
+    print("Wrote {0!s} to {1!s}".format(argv[2], mmap_dir))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
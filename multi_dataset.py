@@ -0,0 +1,113 @@
+'''
+Runs the bias correction and threshold analyses over every CSV in a directory or glob, i.e. one COMPAS
+format export per county per month, and merges the results into one report.
+
+Each file is analyzed on its own worker of a process pool. A worker only loads the columns it needs
+(through the CSV cache) and sends back small per-trait tables and its error histograms, so throughput
+scales with the number of cores. The error histograms of every file are also added up, so the report
+includes the bias and error of each trait over all files together, the same as analyzing them as one CSV.
+
+i.e. python multi_dataset.py "./exports/*.csv" race decile_score ./report --workers 8
+     python multi_dataset.py ./exports race decile_score ./report
+
+writes bias_report.csv, threshold_report.csv and best_thresholds.csv to ./report
+'''
+import os
+import sys
+import glob
+import argparse
+import contextlib
+import concurrent.futures
+import matplotlib
+matplotlib.use('Agg')
+import pandas as pd
+
+import plot_by_attr
+import plot_by_attr_threshold
+from bias_stats import bias_table
+
+ALL_FILES = "ALL"
+
+
+def find_csvs(path_or_glob):
+    '''
+    Returns the sorted CSV paths in a directory, or matching a glob
+    '''
+    if os.path.isdir(path_or_glob):
+        path_or_glob = os.path.join(path_or_glob, "*.csv")
+    return sorted(glob.glob(path_or_glob))
+
+
+def analyze_file(filepath, col_name, recid_dec_col_name, thresholds=range(1, 10)):
+    '''
+    Runs both analyses on one CSV, for every trait in col_name. Returns the error histograms, the bias
+    table, and the threshold and best threshold frames.
+    '''
+    columns = [col_name, recid_dec_col_name]
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        analyzer = plot_by_attr.DataAnalyzer(filepath, columns=columns)
+        traits = list(analyzer.trait_breakdown(col_name).index)
+        stats = analyzer.error_stats(col_name, recid_dec_col_name, traits)
+        threshold_analyzer = plot_by_attr_threshold.DataAnalyzer(filepath, session=analyzer.session)
+        threshold_frame, best_thresholds = threshold_analyzer.threshold_sweep_all_traits(col_name, recid_dec_col_name,
+                                                                                         thresholds=thresholds)
+    return {"stats": stats,
+            "bias": bias_table(stats),
+            "thresholds": threshold_frame,
+            "best_thresholds": best_thresholds}
+
+
+def analyze_files(filepaths, col_name, recid_dec_col_name, thresholds=range(1, 10), workers=None):
+    '''
+    Runs analyze_file over every file (at least one) on a process pool and merges the results into report
+    frames, each with the file as the outer index level. The bias report also has the pooled results of
+    all files as ALL.
+    '''
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(analyze_file, filepath, col_name, recid_dec_col_name, thresholds)
+                   for filepath in filepaths]
+        results = [future.result() for future in futures]
+
+    pooled_stats = results[0]["stats"]
+    for result in results[1:]:
+        pooled_stats = pooled_stats.merge(result["stats"])
+    file_names = [os.path.basename(filepath) for filepath in filepaths]
+    bias_tables = [result["bias"] for result in results] + [bias_table(pooled_stats)]
+    report = {"bias": pd.concat(bias_tables, keys=file_names + [ALL_FILES], names=["file"])}
+    for key in ["thresholds", "best_thresholds"]:
+        report[key] = pd.concat([result[key] for result in results], keys=file_names, names=["file"])
+    return report
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Analyze every CSV in a directory or glob and merge the results")
+    parser.add_argument("path", help="directory of CSVs, or a glob like './exports/*.csv'")
+    parser.add_argument("col_name", help="column to group by, i.e. race")
+    parser.add_argument("recid_dec_col_name", help="score column, i.e. decile_score")
+    parser.add_argument("output_dir", help="directory to write the report to")
+    parser.add_argument("--workers", type=int, default=None, help="processes to use, default one per core")
+    parser.add_argument("--thresholds", default=None, help="comma separated thresholds, default 1-9")
+    args = parser.parse_args(argv[1:])
+
+    filepaths = find_csvs(args.path)
+    if not filepaths:
+        print("No CSV files found for {0!s}".format(args.path))
+        return 1
+    thresholds = range(1, 10)
+    if args.thresholds:
+        thresholds = [float(threshold) for threshold in args.thresholds.split(",")]
+
+    report = analyze_files(filepaths, args.col_name, args.recid_dec_col_name, thresholds=thresholds,
+                           workers=args.workers)
+    if not os.path.isdir(args.output_dir):
+        os.makedirs(args.output_dir)
+    report["bias"].to_csv(os.path.join(args.output_dir, "bias_report.csv"))
+    report["thresholds"].to_csv(os.path.join(args.output_dir, "threshold_report.csv"))
+    report["best_thresholds"].to_csv(os.path.join(args.output_dir, "best_thresholds.csv"))
+    print("Analyzed {0!s} files".format(len(filepaths)))
+    print(report["bias"].loc[ALL_FILES])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
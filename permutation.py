@@ -0,0 +1,81 @@
+'''
+Permutation tests for differences in baseline bias between groups.
+
+Under the null hypothesis that two groups' errors come from the same distribution, shuffling the group
+labels of their people changes nothing. Shuffling only decides which of the pooled people land in the
+first group, so a permutation is a draw of the first group's error histogram from a multivariate
+hypergeometric over the pooled histogram, and the second group gets the rest. Each permutation costs
+O(error values) rather than a pass over the rows, and a batch of them is one numpy call.
+
+Batches of every pair of groups run on a process pool. Each has its own seed spawned from one seed, so
+p-values only depend on the seed and number of permutations, not on the number of workers.
+'''
+import itertools
+import concurrent.futures
+import numpy as np
+import pandas as pd
+
+DEFAULT_PERMUTATIONS = 10000
+BATCH_PERMUTATIONS = 2000
+# permuted gaps this close to the observed one count as equally extreme, since they are summed differently
+GAP_TOLERANCE = 1e-9
+
+
+def permuted_bias_gaps(error_values, counts, other_counts, num_permutations, seed):
+    '''
+    Returns the bias of the first group minus the bias of the second after each of num_permutations
+    shuffles of their labels, given each group's error histogram
+    '''
+    rng = np.random.default_rng(seed)
+    pooled = counts + other_counts
+    members, other_members = counts.sum(), other_counts.sum()
+    samples = rng.multivariate_hypergeometric(pooled, members, size=num_permutations, method="marginals")
+    total_error = samples.dot(error_values)
+    other_total_error = pooled.dot(error_values) - total_error
+    return total_error / float(members) - other_total_error / float(other_members)
+
+
+def permutation_test(stats, groups=None, num_permutations=DEFAULT_PERMUTATIONS, workers=None, seed=0):
+    '''
+    Tests the difference in baseline bias of every pair of groups (all groups of stats by default). Returns
+    a frame with a row per pair with both biases, their gap and its two-sided p-value. Permutations are
+    spread over workers processes, one per core by default, or run here if workers is 1.
+    '''
+    if groups is None:
+        groups = list(stats.groups)
+    members = stats.members()
+    for group in groups:
+        if members[stats.groups.get_loc(group)] == 0:
+            raise ValueError("No members found in group {0!s}".format(group))
+    bias = stats.bias()
+    pairs = list(itertools.combinations(groups, 2))
+    batch_sizes = [BATCH_PERMUTATIONS] * (num_permutations // BATCH_PERMUTATIONS)
+    if num_permutations % BATCH_PERMUTATIONS:
+        batch_sizes.append(num_permutations % BATCH_PERMUTATIONS)
+    seeds = iter(np.random.SeedSequence(seed).spawn(len(pairs) * len(batch_sizes)))
+
+    tasks = []
+    for group, other_group in pairs:
+        counts = stats.counts[stats.groups.get_loc(group)]
+        other_counts = stats.counts[stats.groups.get_loc(other_group)]
+        tasks.extend((stats.error_values, counts, other_counts, size, next(seeds)) for size in batch_sizes)
+    if workers == 1:
+        gaps = [permuted_bias_gaps(*task) for task in tasks]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(permuted_bias_gaps, *task) for task in tasks]
+            gaps = [future.result() for future in futures]
+
+    rows = []
+    for pos, (group, other_group) in enumerate(pairs):
+        permuted = np.concatenate(gaps[pos * len(batch_sizes):(pos + 1) * len(batch_sizes)])
+        group_bias, other_bias = bias[stats.groups.get_loc(group)], bias[stats.groups.get_loc(other_group)]
+        extreme = np.count_nonzero(np.abs(permuted) >= abs(group_bias - other_bias) - GAP_TOLERANCE)
+        rows.append({"group": group,
+                     "other_group": other_group,
+                     "bias": group_bias,
+                     "other_bias": other_bias,
+                     "bias_gap": group_bias - other_bias,
+                     # counting the observed labels as one of the permutations, so p is never 0
+                     "p_value": (extreme + 1) / float(num_permutations + 1)})
+    return pd.DataFrame(rows, columns=["group", "other_group", "bias", "other_bias", "bias_gap", "p_value"])
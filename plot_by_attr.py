@@ -1,7 +1,4 @@
-import cmd
 import sys
-import os
-import csv
 import math
 import numpy as np
 import matplotlib
@@ -9,18 +6,12 @@ import matplotlib.pyplot as plt
 matplotlib.style.use('ggplot')
 import pandas as pd
 from pandas import DataFrame, Series
+from analysis_core import CSVReaderConst, BaseAnalyzer, BaseShell, run_shell
+from bootstrap import DEFAULT_CONFIDENCE, DEFAULT_REPLICATES, bootstrap_intervals
+from permutation import DEFAULT_PERMUTATIONS, permutation_test
+from error_models import DEFAULT_MODELS, evaluate_models, is_model_spec, parse_models
 
-class CSVReaderConst(object):
-    HIGHEST_RISK = 10
-    LOWEST_RISK = 1
-    RACES_TO_CORRECT = ["African American", "White"]
-    RECIDIVISM_COL_NAME = "two_year_recid"
-
-class DataAnalyzer(object):
-    def __init__(self, filepath_in):
-        self.plot_filepath = filepath_in
-        self.df = pd.read_csv(filepath_in)
-        
+class DataAnalyzer(BaseAnalyzer):
     def _get_median(self, some_list):
         if len(some_list) is 0:
             return None
@@ -29,72 +20,32 @@ class DataAnalyzer(object):
         else:
             return float(some_list[len(some_list)/2] + some_list[len(some_list)/2 + 1])/2
 
-    def trait_breakdown(self, col_name):
-        '''
-        Returns a dictionary of each different trait, and its count within a given column
-        '''
-        breakdown = self.df[col_name.lower()].value_counts(sort=True, ascending=False)
-        print(breakdown)
-        return breakdown
-
-    def plot_recid(self, col_name, attr, recid_dec_col_name):
-        '''
-        Plots the breakdown of those who actually commit recidivism by the recidivism score they received
-        '''
-        # cuts down table to only where attr exists, creates 2D table using decile, and actual recidivism occuring
-        updated_df = self.df[self.df[col_name] == attr]
-        recid_table = pd.crosstab(index=updated_df[recid_dec_col_name.lower()],
-                                  columns=updated_df[CSVReaderConst.RECIDIVISM_COL_NAME])
-        
-        recid_table.plot(kind="bar",
-                         figsize=(8, 8),
-                         stacked=True,
-                         title="{0!s}, {1!s} = {2!s}".format(recid_dec_col_name.capitalize(),
-                                                             col_name.capitalize(),
-                                                             attr.capitalize()))
-        plt.draw()
-        plt.pause(0.001)
-
     def correct_for(self, col_name, recid_dec_col_name, traits=[], rms=False):
         '''
-        Across same col_name, correct the attribute for each trait to remove bias
+        Across same col_name, correct the attribute for each trait to remove bias. col_name can be several
+        comma separated columns, i.e. race,sex,age_cat, to correct each combination of them that occurs,
+        with traits as tuples of their values.
         '''
-        if traits == []:
-            trait_dict = self.trait_breakdown(col_name=col_name)
-            for trait, percentage in trait_dict.iteritems():
-                traits.append(trait)
-
+        traits = self._traits_or_all(col_name, traits)
         print(traits)
+        stats = self.error_stats(col_name, recid_dec_col_name, traits)
+        trait_pos = stats.groups.get_indexer(pd.Index(traits, dtype=object))
+        members = stats.members()
+        with self.profiler.stage("correct", rows=members.sum()):
+            abs_error, bias, rms_error = stats.abs_error(), stats.bias(), stats.rms_error()
+            new_abs_error, new_rms_error = stats.abs_error(corrected=True), stats.rms_error(corrected=True)
         baseline_error_dict = {}
         rms_error_dict = {}
         baseline_bias_dict = {}
-        
+
         # for each trait, get some error and bias which can be printed/corrected for
-        for trait in traits:
-            group = self.df[self.df[col_name] == trait]
-            num_members = len(group)
-            total_abs_error = 0
-            total_error = 0
-            total_squared_residuals = 0
-            # iterate through each person in group
-            for index, person in group.iterrows():
-                if int(person[CSVReaderConst.RECIDIVISM_COL_NAME]) == 1:
-                    # if recidivism occured, we should expect a high risk, use HIGHEST_RISK
-                    person_error = float(person[recid_dec_col_name]) - CSVReaderConst.HIGHEST_RISK
-                else:
-                    # if recidivism did not occur, we should expect a low risk, use LOWEST_RISK
-                    person_error = float(person[recid_dec_col_name]) - CSVReaderConst.LOWEST_RISK
-                # compound error (for bias calculation), and absolute error
-                total_error += person_error
-                total_squared_residuals += pow(person_error, 2)
-                total_abs_error += abs(person_error)
-            if num_members == 0:
+        for trait, pos in zip(traits, trait_pos):
+            if members[pos] == 0:
                 raise ValueError("No members found in group {0!s}".format(trait))
-            baseline_bias = total_error/float(num_members)
             # if mostly over-predicted, baseline bias positive. if under, negative.
-            baseline_error_dict[trait] = total_abs_error/float(num_members)
-            baseline_bias_dict[trait] = baseline_bias
-            rms_error_dict[trait] = math.sqrt(total_squared_residuals/float(num_members))
+            baseline_error_dict[trait] = abs_error[pos]
+            baseline_bias_dict[trait] = bias[pos]
+            rms_error_dict[trait] = rms_error[pos]
             if rms:
                 print("For group {0!s}, rms error: {1:.3f}, baseline bias: {2:.3f}".format(trait,
                                                                                            rms_error_dict[trait],
@@ -104,34 +55,14 @@ class DataAnalyzer(object):
                                                                                                 baseline_error_dict[trait],
                                                                                                 baseline_bias_dict[trait]))
 
-        # bias correction calculation, now that we have bias per demographic (trait)                                                                                
+        # bias correction calculation, now that we have bias per demographic (trait). the corrected errors
+        # come from the same histogram, shifted by each trait's bias
         print("=========================================")
         new_error_dict = {}
         new_rms_error_dict = {}
-        new_baseline_dict = {}
-        for trait in traits:
-            group = self.df[self.df[col_name] == trait]
-            num_members = len(group)
-            new_total_error = 0
-            total_abs_error = 0
-            total_squared_residuals = 0
-            for index, person in group.iterrows():
-                # adjust/correct for bias of this group, subtract per person
-                corrected_decile = float(person[recid_dec_col_name]) - float(baseline_bias_dict[trait])
-                if int(person[CSVReaderConst.RECIDIVISM_COL_NAME]) == 1:
-                    person_error = float(corrected_decile) - CSVReaderConst.HIGHEST_RISK
-                else:
-                    person_error = float(corrected_decile) - CSVReaderConst.LOWEST_RISK
-                new_total_error += person_error
-                total_abs_error += abs(person_error)
-                total_squared_residuals += pow(person_error, 2)
-            if num_members == 0:
-                raise ValueError("No members found in group {0!s}".format(trait))
-            # bias should turn to 0 every time since we corrected everyone for this
-            new_baseline_bias = new_total_error/float(num_members)
-            new_error_dict[trait] = total_abs_error/float(num_members)
-            new_rms_error_dict[trait] = math.sqrt(total_squared_residuals/float(num_members))
-            new_baseline_dict[trait] = new_baseline_bias
+        for trait, pos in zip(traits, trait_pos):
+            new_error_dict[trait] = new_abs_error[pos]
+            new_rms_error_dict[trait] = new_rms_error[pos]
             if rms:
                 print("For group {0!s}, corrected rms error: {1:.3f}".format(trait, new_rms_error_dict[trait]))
             else:
@@ -139,48 +70,147 @@ class DataAnalyzer(object):
 
         return baseline_error_dict, rms_error_dict, baseline_bias_dict, new_error_dict, new_rms_error_dict
 
+    def bootstrap(self, col_name, recid_dec_col_name, traits=[], replicates=DEFAULT_REPLICATES,
+                  confidence=DEFAULT_CONFIDENCE, workers=None, seed=0):
+        '''
+        Confidence intervals for the bias and errors correct_for reports for each trait, from bootstrap
+        replicates drawn on a process pool with one worker per core by default
+        '''
+        traits = self._traits_or_all(col_name, traits)
+        stats = self.error_stats(col_name, recid_dec_col_name, traits)
+        with self.profiler.stage("resample", rows=stats.members().sum() * replicates):
+            intervals = bootstrap_intervals(stats, num_replicates=replicates, confidence=confidence,
+                                            workers=workers, seed=seed).loc[traits]
+        print("{0:.0f}% intervals from {1!s} bootstrap replicates".format(confidence * 100, replicates))
+        for trait, (_, trait_res) in zip(traits, intervals.iterrows()):
+            print("For group {0!s}, members: {1!s}".format(trait, stats.members()[stats.groups.get_loc(trait)]))
+            for metric in ["baseline_bias", "baseline_error", "rms_error", "new_error", "new_rms_error"]:
+                print("    {0!s}: {1:.3f} ({2:.3f} to {3:.3f})".format(metric, trait_res[metric],
+                                                                       trait_res[metric + "_low"],
+                                                                       trait_res[metric + "_high"]))
+
+        title = "Baseline Bias {0!s}, {1:.0f}% Bootstrap Intervals".format(col_name.capitalize(), confidence * 100)
+        self._plot("bootstrap_{0!s}_{1!s}".format(recid_dec_col_name, col_name), self._draw_intervals, intervals, title)
+        return intervals
 
-class AnalyzerShell(cmd.Cmd):
-    intro = 'Welcome to the analyzer shell. Type help or ? to list commands.\n'
-    prompt = '(analyzer) '
-    def setup(self, file_path):
-        self.data_analyzer = DataAnalyzer(file_path)
+    def bias_gap_test(self, col_name, recid_dec_col_name, traits=[], permutations=DEFAULT_PERMUTATIONS, workers=None,
+                      seed=0):
+        '''
+        Permutation test of whether the baseline bias of each pair of traits differs, with the permutations
+        run on a process pool with one worker per core by default
+        '''
+        traits = self._traits_or_all(col_name, traits)
+        stats = self.error_stats(col_name, recid_dec_col_name, traits)
+        with self.profiler.stage("resample", rows=stats.members().sum() * permutations):
+            tests = permutation_test(stats, groups=traits, num_permutations=permutations, workers=workers, seed=seed)
+        print("p-values from {0!s} permutations".format(permutations))
+        for _, test in tests.iterrows():
+            print("Bias of {0!s} minus {1!s}: {2:.3f} - {3:.3f} = {4:.3f}, p = {5:.4f}".format(test["group"],
+                                                                                             test["other_group"],
+                                                                                             test["bias"],
+                                                                                             test["other_bias"],
+                                                                                             test["bias_gap"],
+                                                                                             test["p_value"]))
+        return tests
+
+    def score_models(self, col_name, recid_dec_col_name, traits=[], models=DEFAULT_MODELS):
+        '''
+        Scores each trait with every error model of error_models.py, at baseline and once corrected for its
+        bias. models is a spec like linear,huber,log_loss:is_violent_recid or huber(delta=2):is_violent_recid@8/2,
+        or a list of ErrorModels, all of which are scored from one pass over the data.
+        '''
+        traits = self._traits_or_all(col_name, traits)
+        if not isinstance(models, list):
+            models = parse_models(models)
+        outcome_cols = list(dict.fromkeys(model.outcome_col for model in models))
+        histograms = self.session.outcome_histograms(col_name, recid_dec_col_name, traits, outcome_cols)
+        positive_hist, negative_hist = histograms["histograms"][outcome_cols[0]]
+        members = positive_hist.sum(axis=1) + negative_hist.sum(axis=1)
+        for trait, num_members in zip(histograms["trait_index"], members):
+            if num_members == 0:
+                raise ValueError("No members found in group {0!s}".format(trait))
 
-    def do_trait_breakdown(self, arg):
-        'Get a percentage and count breakdown of specified argument'
-        self.data_analyzer.trait_breakdown(col_name=arg)
+        with self.profiler.stage("correct", rows=members.sum() * len(models)):
+            scores = evaluate_models(models, histograms)
+        scores.index = scores.index.set_names(["model"] + col_name.split(","))
+        print(scores)
+        return scores
 
-    def do_plot_recid(self, arg):
-        'Plot the value of recidivism decile, with a stacked chart of how many actually had recidivism for this attribute.\n \
-        i.e. plot_recid race Caucasian decile_score'
-        split_up = arg.split(" ")
-        self.data_analyzer.plot_recid(*split_up)
+    def _draw_intervals(self, fig, intervals, title):
+        ax = fig.add_subplot(111)
+        errors = [intervals["baseline_bias"] - intervals["baseline_bias_low"],
+                  intervals["baseline_bias_high"] - intervals["baseline_bias"]]
+        positions = np.arange(len(intervals))
+        ax.errorbar(positions, intervals["baseline_bias"], yerr=errors, fmt="o", capsize=4)
+        ax.axhline(0, color="gray", linewidth=1)
+        ax.set_xticks(positions)
+        ax.set_xticklabels(["{0!s}".format(trait) for trait in intervals.index], rotation=30, ha="right")
+        ax.set_ylabel("Baseline Bias")
+        ax.set_title(title)
+        fig.tight_layout()
+
+
+class AnalyzerShell(BaseShell):
+    analyzer_class = DataAnalyzer
 
     def do_correct_for(self, arg, calc_rms=False):
         'Correct a particular decile score attribute based on a specific column.\nSpecificy traits in the column to correct, or "ALL" for an analysis of all. \
-         \ni.e. correct_for decile_score race African-American, Caucasian OR correct_for decile_score race ALL'
+         \ni.e. correct_for decile_score race African-American, Caucasian OR correct_for decile_score race ALL \
+         \nGive several columns to correct each combination of them, i.e. correct_for decile_score race,sex ALL OR correct_for decile_score race,sex African-American/Male, Caucasian/Female'
         split_up = arg.split(" ", 2)
         # print(split_up)
         dec_name = split_up[0]
         col_name = split_up[1]
-        traits = split_up[2].split(", ")
-        if (traits[0] == "ALL"):
-            traits = []
-        self.data_analyzer.correct_for(col_name=col_name, recid_dec_col_name=dec_name, traits=traits, rms=calc_rms)
+        traits = self._parse_traits(col_name, split_up[2])
+        results = self.data_analyzer.correct_for(col_name=col_name, recid_dec_col_name=dec_name, traits=traits, rms=calc_rms)
+        self.last_result = pd.DataFrame(dict(zip(["baseline_error", "rms_error", "baseline_bias", "new_error", "new_rms_error"],
+                                                 results)))
     
     def do_correct_for_rms(self, arg):
         'Same as correct_for, but using root mean squared error instead of linear error calculation'
         self.do_correct_for(arg=arg, calc_rms=True)
 
-    def do_quit(self, arg):
-        'Quit'
-        print('Thank you for using analyzer')
-        return True
+    def do_bootstrap(self, arg):
+        'Confidence intervals for the bias and errors of correct_for, optionally giving the number of bootstrap replicates first.\n \
+        i.e. bootstrap decile_score race ALL OR bootstrap 5000 decile_score race Asian, Native American'
+        replicates = DEFAULT_REPLICATES
+        split_up = arg.split(" ", 1)
+        if split_up[0].isdigit():
+            replicates = int(split_up[0])
+            arg = split_up[1]
+        split_up = arg.split(" ", 2)
+        traits = self._parse_traits(split_up[1], split_up[2])
+        self.last_result = self.data_analyzer.bootstrap(col_name=split_up[1], recid_dec_col_name=split_up[0],
+                                                        traits=traits, replicates=replicates)
+
+    def do_bias_gap_test(self, arg):
+        'Permutation test of the difference in baseline bias between each pair of traits, optionally giving the number of permutations first.\n \
+        i.e. bias_gap_test decile_score race African-American, Caucasian OR bias_gap_test 50000 decile_score race ALL'
+        permutations = DEFAULT_PERMUTATIONS
+        split_up = arg.split(" ", 1)
+        if split_up[0].isdigit():
+            permutations = int(split_up[0])
+            arg = split_up[1]
+        split_up = arg.split(" ", 2)
+        traits = self._parse_traits(split_up[1], split_up[2])
+        self.last_result = self.data_analyzer.bias_gap_test(col_name=split_up[1], recid_dec_col_name=split_up[0],
+                                                            traits=traits, permutations=permutations)
+
+    def do_score_models(self, arg):
+        'Score each trait with several error models at once, at baseline and once corrected for its bias, optionally giving the models first.\n \
+        Models are loss[(delta=D)][:outcome_col][@positive/negative], with loss one of linear, rms, huber or log_loss, delta the Huber delta (1 by default),\n \
+        outcome_col two_year_recid by default, or is_violent_recid, and positive/negative the targets of those with and without the outcome (10/1 by default).\n \
+        i.e. score_models decile_score race ALL OR score_models linear,huber,log_loss:is_violent_recid decile_score race African-American, Caucasian\n \
+        OR score_models huber(delta=2):is_violent_recid@8/2 decile_score race ALL'
+        models = DEFAULT_MODELS
+        split_up = arg.split(" ", 1)
+        if is_model_spec(split_up[0]):
+            models = split_up[0]
+            arg = split_up[1]
+        split_up = arg.split(" ", 2)
+        traits = self._parse_traits(split_up[1], split_up[2])
+        self.last_result = self.data_analyzer.score_models(col_name=split_up[1], recid_dec_col_name=split_up[0],
+                                                           traits=traits, models=models)
 
 if __name__ == '__main__':
-    if len(sys.argv) < 2:
-        print("Need filepath")
-    else:
-        shell = AnalyzerShell()
-        shell.setup(os.path.normpath(sys.argv[1]))
-        shell.cmdloop()
\ No newline at end of file
+    sys.exit(run_shell(AnalyzerShell(), sys.argv))
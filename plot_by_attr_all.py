@@ -0,0 +1,61 @@
+'''
+One shell for the analyses of plot_by_attr.py, plot_by_attr_non_uniform.py and plot_by_attr_threshold.py,
+over a single load of the CSV.
+
+Has every command of plot_by_attr.py, along with the non-uniform and threshold commands under their own
+names. The analyzers of the three scripts share one AnalysisSession, so the dataset, its row indexes,
+the cached results and the renderer are shared too.
+
+i.e. python plot_by_attr_all.py ./compas-analysis/compas-scores-two-years.csv
+     (analyzer) correct_for decile_score race ALL
+     (analyzer) correct_for_non_uniform decile_score race ALL
+     (analyzer) fair_thresholds race decile_score fpr 0.02
+'''
+import sys
+
+import plot_by_attr
+import plot_by_attr_non_uniform
+import plot_by_attr_threshold
+from analysis_core import run_shell
+
+
+class AnalyzerShell(plot_by_attr.AnalyzerShell):
+    def setup(self, file_path, columns=None, chunksize=None, profiler=None, mmap=False, session=None):
+        plot_by_attr.AnalyzerShell.setup(self, file_path, columns=columns, chunksize=chunksize, profiler=profiler,
+                                         mmap=mmap, session=session)
+        self.non_uniform_shell = plot_by_attr_non_uniform.AnalyzerShell()
+        self.non_uniform_shell.setup(file_path, session=self.data_analyzer.session)
+        self.threshold_shell = plot_by_attr_threshold.AnalyzerShell()
+        self.threshold_shell.setup(file_path, session=self.data_analyzer.session)
+
+    def _run(self, command, arg):
+        # runs the command of another script's shell, taking its result as this shell's
+        command(arg)
+        self.last_result = command.__self__.last_result
+
+    def do_correct_for_non_uniform(self, arg):
+        'Same as correct_for, but correcting each decile of each trait by its own bias, as in plot_by_attr_non_uniform.\n \
+        i.e. correct_for_non_uniform decile_score race ALL'
+        self._run(self.non_uniform_shell.do_correct_for, arg)
+
+    def do_correct_for_non_uniform_rms(self, arg):
+        'Same as correct_for_non_uniform, but using root mean squared error instead of linear error calculation'
+        self._run(self.non_uniform_shell.do_correct_for_rms, arg)
+
+    def do_plot_threshold(self, arg):
+        'Plot the false positives and negatives of a trait at each threshold, as in plot_by_attr_threshold.\n \
+        i.e. plot_threshold race Caucasian decile_score OR plot_threshold race ALL decile_score 2.5,4,5.5'
+        self._run(self.threshold_shell.do_plot_threshold, arg)
+
+    def do_plot_threshold_all_traits(self, arg):
+        'Same as plot_threshold, but for every trait in the column at once, reporting the lowest error threshold for each.\n \
+        i.e. plot_threshold_all_traits race decile_score'
+        self._run(self.threshold_shell.do_plot_threshold_all_traits, arg)
+
+    def do_fair_thresholds(self, arg):
+        'Pick a threshold for every trait minimizing total error, with fpr, fnr or bias within a tolerance across traits, or none.\n \
+        i.e. fair_thresholds race decile_score OR fair_thresholds race decile_score bias 0.05'
+        self._run(self.threshold_shell.do_fair_thresholds, arg)
+
+if __name__ == '__main__':
+    sys.exit(run_shell(AnalyzerShell(), sys.argv))
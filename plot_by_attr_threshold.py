@@ -1,66 +1,59 @@
-import cmd
 import sys
-import os
-import csv
 import numpy as np
 import matplotlib
 import matplotlib.pyplot as plt
 matplotlib.style.use('ggplot')
 import pandas as pd
 from pandas import DataFrame, Series
+from analysis_core import CSVReaderConst, BaseAnalyzer, BaseShell, score_histograms, sweep_thresholds, run_shell
+from threshold_solver import DEFAULT_CONSTRAINT, DEFAULT_TOLERANCE, constraint_metric, solve_thresholds
+
+class DataAnalyzer(BaseAnalyzer):
+    def threshold_sweep(self, col_name, trait, recid_dec_col_name, thresholds=range(1, 10)):
+        '''
+        Calculates false pos, neg, error and bias for a group at each threshold, where scores above the
+        threshold predict recidivism. Using ALL as the trait uses everyone. Thresholds can be any grid,
+        including fractional values for continuous scores.
+        '''
+        self.session.require_loaded("threshold_sweep")
+        return self.session.cached("threshold_sweep", [col_name, recid_dec_col_name], [trait], tuple(thresholds),
+                                   lambda: self._threshold_sweep(col_name, trait, recid_dec_col_name, thresholds))
+
+    def _threshold_sweep(self, col_name, trait, recid_dec_col_name, thresholds):
+        frame = self.df
+        if trait != "ALL":
+            frame = frame.iloc[self.session.trait_rows(col_name, frame).rows(trait)]
+        if len(frame) == 0:
+            raise ValueError("No members found in group {0!s}".format(trait))
+
+        with self.profiler.stage("aggregate", rows=len(frame)):
+            scores = frame[recid_dec_col_name].values.astype(float)
+            recid = frame[CSVReaderConst.RECIDIVISM_COL_NAME].values.astype(np.int64) == 1
+            score_values, recid_hist, non_recid_hist = score_histograms(np.zeros(len(frame), dtype=np.int64), 1,
+                                                                        scores, recid)
+            false_pos, false_neg = sweep_thresholds(score_values, recid_hist, non_recid_hist, thresholds)
 
-class CSVReaderConst(object):
-    HIGHEST_RISK = 10
-    LOWEST_RISK = 1
-    THRESHOLD_RISK = 4
-    RACES_TO_CORRECT = ["African American", "White"]
-    RECIDIVISM_COL_NAME = "two_year_recid"
-
-class DataAnalyzer(object):
-    def __init__(self, filepath_in):
-        self.plot_filepath = filepath_in
-        self.df = pd.read_csv(filepath_in)
-
-    def trait_breakdown(self, col_name):
-        breakdown = self.df[col_name.lower()].value_counts(sort=True, ascending=False)
-        print(breakdown)
-        return breakdown
-        
-    def plot_threshold(self, col_name, trait, recid_dec_col_name):
         threshold_res = {}
-        
+        for idx, threshold in enumerate(thresholds):
+            num_false_pos = int(false_pos[0, idx])
+            num_false_neg = int(false_neg[0, idx])
+            threshold_res[threshold] = {"false_neg": num_false_neg,
+                                        "false_pos": num_false_pos,
+                                        "error": num_false_pos + num_false_neg,
+                                        "bias": (num_false_pos - num_false_neg)/float(len(frame))}
+        return threshold_res
+
+    def plot_threshold(self, col_name, trait, recid_dec_col_name, thresholds=range(1, 10)):
         # calculate false pos, neg, error, etc. for a group across all possible threshold values
-        for threshold in range(1, 10):
-            threshold_res[threshold] = {"false_neg": 0, "false_pos": 0, "error": 0, "bias": 0}
-            signed_error = 0
-            
-            frame = self.df
-            if trait != "ALL":
-                frame = self.df[self.df[col_name] == trait]
-                
-            for index, person in frame.iterrows():
-                person_error = 0
-                
-                if int(person[CSVReaderConst.RECIDIVISM_COL_NAME]) == 1:
-                    if int(person[recid_dec_col_name] <= threshold):
-                        person_error = -1
-                        threshold_res[threshold]["false_neg"] += 1
-                else:
-                    if int(person[recid_dec_col_name] > threshold):
-                        person_error = 1
-                        threshold_res[threshold]["false_pos"] += 1
-                        
-                threshold_res[threshold]["error"] += abs(person_error)
-                signed_error += person_error
-                
-            threshold_res[threshold]["bias"] = signed_error/float(len(frame))
+        threshold_res = self.threshold_sweep(col_name, trait, recid_dec_col_name, thresholds=thresholds)
+        for threshold in thresholds:
             print("Stats for {0!s}: {1!s} at threshold {2!s} --> error: {3:.3f}, bias: {4:.3f}".format(col_name,
                                                                                                        trait,
                                                                                                        threshold,
                                                                                                        threshold_res[threshold]["error"],
                                                                                                        threshold_res[threshold]["bias"]))
         print(threshold_res)
-        
+
         # plot out the false pos, neg, error, etc. for this group
         default_color = "blue"
         lowest_error_color = "magenta"
@@ -69,7 +62,7 @@ class DataAnalyzer(object):
         colors = []
         error_labels = []
         error_vals = []
-        for threshold in sorted(threshold_res.iterkeys()):
+        for threshold in sorted(threshold_res):
             val_dict = threshold_res[threshold]
             x_coords.append(val_dict["false_pos"])
             y_coords.append(val_dict["false_neg"])
@@ -80,45 +73,162 @@ class DataAnalyzer(object):
         # change color for lowest error producing threshold
         colors[error_vals.index(min(error_vals))] = lowest_error_color
         
-        fig = plt.figure()
-        plt.scatter(x_coords, y_coords, c=colors)
-        plt.xlabel("False Positives")
-        plt.ylabel("False Negatives")
+        title = "Threshold Plot {0!s}\n{1!s} = {2!s}".format(recid_dec_col_name, col_name.capitalize(), trait)
+        self._plot("threshold_{0!s}_{1!s}_{2!s}".format(col_name, trait, recid_dec_col_name),
+                   self._draw_threshold, x_coords, y_coords, colors, error_labels, title)
+        return threshold_res
+
+    def _draw_threshold(self, fig, x_coords, y_coords, colors, error_labels, title):
+        ax = fig.add_subplot(111)
+        ax.scatter(x_coords, y_coords, c=colors)
+        ax.set_xlabel("False Positives")
+        ax.set_ylabel("False Negatives")
         for idx, label in enumerate(error_labels):
-            plt.annotate(label, (x_coords[idx], y_coords[idx]))
-        # plt.plot(np.unique(x_coords), np.poly1d(np.polyfit(x_coords, y_coords, 1))(np.unique(x_coords)))
-        plt.draw()
-        plt.title("Threshold Plot {0!s}\n{1!s} = {2!s}".format(recid_dec_col_name, 
-                                                               col_name.capitalize(), 
-                                                               trait))
-        plt.pause(0.001)
+            ax.annotate(label, (x_coords[idx], y_coords[idx]))
+        # ax.plot(np.unique(x_coords), np.poly1d(np.polyfit(x_coords, y_coords, 1))(np.unique(x_coords)))
+        ax.set_title(title)
+
+    def threshold_sweep_all_traits(self, col_name, recid_dec_col_name, thresholds=range(1, 10)):
+        '''
+        Calculates the threshold curve for every trait in col_name from one pass over the data. Returns a
+        frame indexed by (trait, threshold) with false_neg, false_pos, error and bias, and a frame with the
+        lowest error threshold for each trait.
+        '''
+        return self.session.cached("threshold_sweep_all_traits", [col_name, recid_dec_col_name], None, tuple(thresholds),
+                                   lambda: self._threshold_sweep_all_traits(col_name, recid_dec_col_name, thresholds))
 
+    def _threshold_sweep_all_traits(self, col_name, recid_dec_col_name, thresholds):
+        curves = self.session.trait_curves(col_name, recid_dec_col_name, thresholds)
+        traits, thresholds = curves["traits"], curves["thresholds"]
+        false_pos, false_neg, group_sizes = curves["false_pos"], curves["false_neg"], curves["group_sizes"]
+        errors = false_pos + false_neg
 
-class AnalyzerShell(cmd.Cmd):
-    intro = 'Welcome to the analyzer shell. Type help or ? to list commands.\n'
-    prompt = '(analyzer) '
-    def setup(self, file_path):
-        self.data_analyzer = DataAnalyzer(file_path)
+        threshold_frame = pd.DataFrame({"false_neg": false_neg.ravel(),
+                                        "false_pos": false_pos.ravel(),
+                                        "error": errors.ravel(),
+                                        "bias": ((false_pos - false_neg) / group_sizes[:, np.newaxis].astype(float)).ravel()},
+                                       index=pd.MultiIndex.from_product([traits, thresholds],
+                                                                        names=[col_name, "threshold"]),
+                                       columns=["false_neg", "false_pos", "error", "bias"])
+        # ties go to the lowest threshold, same as the magenta point in plot_threshold
+        lowest_error = np.argmin(errors, axis=1)
+        best_thresholds = threshold_frame.iloc[np.arange(len(traits)) * len(thresholds) + lowest_error]
+        best_thresholds = best_thresholds.reset_index(level="threshold")
+        return threshold_frame, best_thresholds
 
-    def do_trait_breakdown(self, arg):
-        'Get a percentage and count breakdown of specified argument'
-        self.data_analyzer.trait_breakdown(col_name=arg)
+    def plot_threshold_all_traits(self, col_name, recid_dec_col_name, thresholds=range(1, 10)):
+        '''
+        Prints and plots threshold_sweep_all_traits, marking the lowest error threshold of each trait
+        '''
+        threshold_frame, best_thresholds = self.threshold_sweep_all_traits(col_name, recid_dec_col_name,
+                                                                           thresholds=thresholds)
+        print(threshold_frame)
+        print("Lowest error threshold per {0!s}:".format(col_name))
+        print(best_thresholds)
+
+        title = "Threshold Plot {0!s}\nAll {1!s}".format(recid_dec_col_name, col_name.capitalize())
+        self._plot("threshold_all_{0!s}_{1!s}".format(col_name, recid_dec_col_name),
+                   self._draw_threshold_curves, threshold_frame, best_thresholds, title)
+        return threshold_frame, best_thresholds
+
+    def fair_thresholds(self, col_name, recid_dec_col_name, constraint=DEFAULT_CONSTRAINT, tolerance=DEFAULT_TOLERANCE,
+                        thresholds=range(1, 10)):
+        '''
+        Picks a threshold for every trait in col_name minimizing the total error over all traits, with the
+        constrained metric of every trait within tolerance of each other. The constraint is one of fpr
+        (false positive rate), fnr (false negative rate), bias, or none for each trait's lowest error
+        threshold. Returns a frame with the chosen threshold of each trait and its results.
+        '''
+        curves = self.session.trait_curves(col_name, recid_dec_col_name, thresholds)
+        false_pos, false_neg = curves["false_pos"], curves["false_neg"]
+        errors = false_pos + false_neg
+        with self.profiler.stage("correct", rows=curves["group_sizes"].sum()):
+            if constraint == "none":
+                choice = np.argmin(errors, axis=1)
+            else:
+                metric = constraint_metric(constraint, false_pos, false_neg, curves["recid_totals"],
+                                           curves["non_recid_totals"])
+                choice = solve_thresholds(errors, metric, tolerance)
+
+        chosen = np.arange(len(curves["traits"]))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            fair_frame = pd.DataFrame({"threshold": np.asarray(curves["thresholds"])[choice],
+                                       "false_neg": false_neg[chosen, choice],
+                                       "false_pos": false_pos[chosen, choice],
+                                       "error": errors[chosen, choice],
+                                       "bias": (false_pos - false_neg)[chosen, choice] / curves["group_sizes"].astype(float),
+                                       "fpr": false_pos[chosen, choice] / curves["non_recid_totals"].astype(float),
+                                       "fnr": false_neg[chosen, choice] / curves["recid_totals"].astype(float)},
+                                      index=pd.Index(curves["traits"], name=col_name),
+                                      columns=["threshold", "false_neg", "false_pos", "error", "bias", "fpr", "fnr"])
+        return fair_frame
+
+    def plot_fair_thresholds(self, col_name, recid_dec_col_name, constraint=DEFAULT_CONSTRAINT, tolerance=DEFAULT_TOLERANCE,
+                             thresholds=range(1, 10)):
+        '''
+        Prints and plots fair_thresholds, against the total error of each trait's lowest error threshold
+        '''
+        fair_frame = self.fair_thresholds(col_name, recid_dec_col_name, constraint=constraint, tolerance=tolerance,
+                                          thresholds=thresholds)
+        threshold_frame, best_thresholds = self.threshold_sweep_all_traits(col_name, recid_dec_col_name,
+                                                                           thresholds=thresholds)
+        if constraint == "none":
+            print("Lowest error threshold per {0!s}:".format(col_name))
+        else:
+            print("Thresholds per {0!s} with {1!s} within {2!s}:".format(col_name, constraint, tolerance))
+        print(fair_frame)
+        print("Total error: {0!s}, at each lowest error threshold: {1!s}".format(fair_frame["error"].sum(),
+                                                                                 best_thresholds["error"].sum()))
+
+        title = "Threshold Plot {0!s}\n{1!s} within {2!s}".format(recid_dec_col_name, constraint, tolerance)
+        self._plot("fair_thresholds_{0!s}_{1!s}_{2!s}".format(col_name, recid_dec_col_name, constraint),
+                   self._draw_threshold_curves, threshold_frame, fair_frame, title)
+        return fair_frame
+
+    def _draw_threshold_curves(self, fig, threshold_frame, best_thresholds, title):
+        ax = fig.add_subplot(111)
+        for trait in threshold_frame.index.get_level_values(0).unique():
+            trait_res = threshold_frame.loc[trait]
+            ax.plot(trait_res["false_pos"], trait_res["false_neg"], marker="o", label="{0!s}".format(trait))
+        ax.scatter(best_thresholds["false_pos"], best_thresholds["false_neg"], c="magenta", zorder=3)
+        ax.set_xlabel("False Positives")
+        ax.set_ylabel("False Negatives")
+        ax.legend()
+        ax.set_title(title)
+
+
+class AnalyzerShell(BaseShell):
+    analyzer_class = DataAnalyzer
 
     def do_plot_threshold(self, arg):
         'Plot the value of false positives and negatives, with a line of best fit of degree 2, based on colname and trait provided.\n \
-        Using ALL will use all people. i.e. plot_threshold race Caucasian decile_score OR plot_threshold race ALL decile_score'
+        Using ALL will use all people. i.e. plot_threshold race Caucasian decile_score OR plot_threshold race ALL decile_score\n \
+        Optionally give comma separated thresholds to use instead of 1-9. i.e. plot_threshold race ALL decile_score 2.5,4,5.5'
         split_up = arg.split(" ")
-        self.data_analyzer.plot_threshold(*split_up)
+        if len(split_up) > 3:
+            split_up[3] = [float(threshold) for threshold in split_up[3].split(",")]
+        threshold_res = self.data_analyzer.plot_threshold(*split_up)
+        self.last_result = pd.DataFrame.from_dict(threshold_res, orient="index")
 
-    def do_quit(self, arg):
-        'Quit'
-        print('Thank you for using analyzer')
-        return True
+    def do_plot_threshold_all_traits(self, arg):
+        'Same as plot_threshold, but for every trait in the column at once, reporting the lowest error threshold for each.\n \
+        i.e. plot_threshold_all_traits race decile_score OR plot_threshold_all_traits race decile_score 2.5,4,5.5'
+        split_up = arg.split(" ")
+        if len(split_up) > 2:
+            split_up[2] = [float(threshold) for threshold in split_up[2].split(",")]
+        self.last_result = self.data_analyzer.plot_threshold_all_traits(*split_up)[0]
+
+    def do_fair_thresholds(self, arg):
+        'Pick a threshold for every trait minimizing total error, with fpr, fnr or bias within a tolerance across traits, or none.\n \
+        Optionally give comma separated thresholds to use instead of 1-9.\n \
+        i.e. fair_thresholds race decile_score OR fair_thresholds race decile_score bias 0.05 OR fair_thresholds race decile_score fpr 0.02 2.5,4,5.5'
+        split_up = arg.split(" ")
+        if len(split_up) > 3:
+            split_up[3] = float(split_up[3])
+        if len(split_up) > 4:
+            split_up[4] = [float(threshold) for threshold in split_up[4].split(",")]
+        self.last_result = self.data_analyzer.plot_fair_thresholds(*split_up)
 
 if __name__ == '__main__':
-    if len(sys.argv) < 2:
-        print("Need filepath and threshold for decile_score")
-    else:
-        shell = AnalyzerShell()
-        shell.setup(os.path.normpath(sys.argv[1]))
-        shell.cmdloop()
+    # the threshold analyses need the CSV loaded, so it can't be streamed
+    sys.exit(run_shell(AnalyzerShell(), sys.argv, stream=False))
@@ -0,0 +1,117 @@
+'''
+Headless rendering of the analyzers' plots to files.
+
+The analyzers normally draw with pyplot on an interactive backend, which blocks on servers without a
+display and keeps every figure open for the whole session. Given a FigureRenderer, they hand each plot
+to it instead. The renderer draws on its own Agg figure in a background thread, writes it to disk in
+each of its formats (i.e. png, svg) and clears it as soon as it is written, so the analysis doesn't wait
+on matplotlib and no figures pile up.
+
+i.e.
+    renderer = FigureRenderer("./figures", formats=["png", "svg"])
+    renderer.submit("threshold_race_ALL", draw_func, *args)   # draw_func(fig, *args) draws on fig
+    renderer.close()                                          # waits for every figure to be written
+'''
+import os
+import re
+import sys
+import threading
+import traceback
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+DEFAULT_FORMATS = ["png"]
+
+
+class FigureRenderer(object):
+    def __init__(self, output_dir, formats=DEFAULT_FORMATS, background=True):
+        '''
+        Writes figures to output_dir in each of formats. With background False, figures are drawn and
+        written as they are submitted instead of on the worker thread.
+        '''
+        self.output_dir = output_dir
+        self.formats = list(formats)
+        self.background = background
+        # added to the start of every file name, i.e. to group the figures of one batch command
+        self.prefix = ""
+        # every path submitted so far, and the tracebacks of figures that failed to render
+        self.paths = []
+        self.failures = []
+        self._jobs = None
+        self._thread = None
+        self._pid = None
+        if not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
+
+    def submit(self, name, draw_func, *args):
+        '''
+        Queues draw_func(fig, *args) to be drawn on a new figure and written as name. Returns the paths it
+        will be written to. args shouldn't be changed after they are submitted.
+        '''
+        base = re.sub(r"[^A-Za-z0-9_.-]+", "_", self.prefix + name)
+        paths = [os.path.join(self.output_dir, "{0!s}.{1!s}".format(base, fmt)) for fmt in self.formats]
+        self.paths.extend(paths)
+        if self.background:
+            self._start_worker()
+            self._jobs.put((paths, draw_func, args))
+        else:
+            self._render(paths, draw_func, args)
+        return paths
+
+    def wait(self):
+        '''
+        Blocks until every submitted figure has been written
+        '''
+        if self._worker_alive():
+            self._jobs.join()
+
+    def close(self):
+        '''
+        Writes every submitted figure, then stops the worker thread
+        '''
+        if self._worker_alive():
+            self._jobs.put(None)
+            self._thread.join()
+        self._thread = None
+
+    def _worker_alive(self):
+        # a forked process inherits the thread object but not the thread
+        return self._thread is not None and self._pid == os.getpid() and self._thread.is_alive()
+
+    def _start_worker(self):
+        if self._worker_alive():
+            return
+        self._jobs = queue.Queue()
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._work, name="FigureRenderer")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _work(self):
+        while True:
+            job = self._jobs.get()
+            try:
+                if job is None:
+                    return
+                self._render(*job)
+            finally:
+                self._jobs.task_done()
+
+    def _render(self, paths, draw_func, args):
+        fig = Figure()
+        FigureCanvasAgg(fig)
+        try:
+            draw_func(fig, *args)
+            for path in paths:
+                fig.savefig(path)
+        except Exception:
+            failure = traceback.format_exc()
+            self.failures.append(failure)
+            sys.stderr.write("Failed to render {0!s}\n{1!s}".format(paths, failure))
+        finally:
+            fig.clear()
@@ -0,0 +1,138 @@
+'''
+Timers for the stages of analyzer commands, to tell where the time of a slow command goes.
+
+Each DataAnalyzer has a Profiler, off by default. When on, the analyzers wrap each stage of their work in
+profiler.stage(name), with name one of STAGES:
+    load         reading the CSV, or the columnar cache of it
+    group_index  building the row index of a column grouped by
+    aggregate    counting or summing over rows, i.e. the error histograms of correct_for
+    correct      turning the aggregates into corrected results, i.e. bias corrected errors
+    resample     bootstrap replicates and permutations
+    render       drawing a plot, or handing it to the renderer, which draws it in the background
+A stage records its seconds, the rows it went over and its peak memory above what was allocated when it
+started, as traced by tracemalloc. Stages can be nested, i.e. group_index inside aggregate, in which
+case the outer stage's time includes the inner one's.
+
+The shell runs every command in profiler.command(line), which prints the stages of the command when it
+is done, appends them as JSON lines to a timing log if one is given, and with a cProfile directory, dumps
+the command's cProfile stats there, i.e. to open with snakeviz or turn into a flame graph with flameprof.
+'''
+import os
+import re
+import json
+import time
+import cProfile
+import datetime
+import contextlib
+import tracemalloc
+
+STAGES = ["load", "group_index", "aggregate", "correct", "resample", "render"]
+
+
+class Profiler(object):
+    def __init__(self):
+        self.enabled = False
+        self.log_path = None
+        self.cprofile_dir = None
+        # stages recorded during the current command
+        self.records = []
+        self._commands = 0
+        self._stack = []
+        self._started_tracing = False
+
+    def enable(self, log_path=None, cprofile_dir=None):
+        '''
+        Starts recording stages. Records are appended to log_path if given, and with a cprofile_dir, every
+        command is also run under cProfile, with its stats dumped there.
+        '''
+        self.log_path = log_path
+        self.cprofile_dir = cprofile_dir
+        if cprofile_dir is not None and not os.path.isdir(cprofile_dir):
+            os.makedirs(cprofile_dir)
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self.enabled = True
+
+    def disable(self):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        self.enabled = False
+
+    @contextlib.contextmanager
+    def stage(self, name, rows=None):
+        '''
+        Times the stage inside the with block. Yields its record, so rows can be set once they are known,
+        i.e. after streaming every chunk.
+        '''
+        record = {"stage": name, "rows": rows}
+        if not self.enabled:
+            yield record
+            return
+        if self._stack:
+            # the outer stage's peak so far, before the inner stage starts its own
+            self._stack[-1]["peak"] = max(self._stack[-1]["peak"], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+        frame = {"start": tracemalloc.get_traced_memory()[0], "peak": 0}
+        self._stack.append(frame)
+        # recorded in the order stages start, so outer stages come before their inner ones
+        self.records.append(record)
+        start = time.time()
+        try:
+            yield record
+        finally:
+            record["seconds"] = time.time() - start
+            if record["rows"] is not None:
+                record["rows"] = int(record["rows"])
+            self._stack.pop()
+            peak = max(frame["peak"], tracemalloc.get_traced_memory()[1])
+            record["peak_mb"] = max(peak - frame["start"], 0) / float(1 << 20)
+            if self._stack:
+                self._stack[-1]["peak"] = max(self._stack[-1]["peak"], peak)
+
+    @contextlib.contextmanager
+    def command(self, line):
+        '''
+        Profiles the shell command line run inside the with block, reporting its stages when it is done
+        '''
+        if not self.enabled:
+            yield
+            return
+        self.records = []
+        self._commands += 1
+        profile = cProfile.Profile() if self.cprofile_dir is not None else None
+        start = time.time()
+        try:
+            if profile is not None:
+                profile.enable()
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+            # unless the command turned profiling off
+            if self.enabled:
+                self.records.append({"stage": "total", "rows": None, "seconds": time.time() - start, "peak_mb": None})
+                self.report(line, profile)
+
+    def report(self, line, profile=None):
+        '''
+        Prints the stages of the command line, and writes them to the timing log and cProfile directory
+        '''
+        print("{0:<14}{1:>10}{2:>12}{3:>14}{4:>10}".format("stage", "seconds", "rows", "rows/sec", "peak MB"))
+        for record in self.records:
+            rows = record["rows"]
+            print("{0:<14}{1:>10.4f}{2:>12}{3:>14}{4:>10}".format(
+                record["stage"], record["seconds"], "" if rows is None else rows,
+                "" if rows is None else "{0:.0f}".format(rows / max(record["seconds"], 1e-9)),
+                "" if record["peak_mb"] is None else "{0:.1f}".format(record["peak_mb"])))
+
+        if self.log_path is not None:
+            now = datetime.datetime.now().isoformat()
+            with open(self.log_path, "a") as f:
+                for record in self.records:
+                    f.write(json.dumps(dict(record, time=now, command=line, pid=os.getpid())) + "\n")
+        if profile is not None:
+            name = re.sub(r"[^A-Za-z0-9]+", "_", line).strip("_")[:80]
+            profile.dump_stats(os.path.join(self.cprofile_dir,
+                                            "{0:04d}_{1!s}_{2!s}.prof".format(self._commands, os.getpid(), name)))
@@ -0,0 +1,142 @@
+'''
+Memoized results of analyzer commands, so a session repeating the same analyses doesn't recompute them.
+
+Results are keyed on (analysis, columns, traits, mode), i.e. ("error_stats", ("race", "decile_score"),
+("Caucasian", "Asian"), None), and kept in memory with least recently used eviction. Given a directory,
+results are also pickled there, so they are reused by later sessions on the same CSV.
+
+The cache belongs to one CSV. Its size and mtime are remembered when the cache is created, and
+dataset_changed tells when they differ, after which the analyzer reloads and resets the cache. Results
+on disk are stored under the content hash of the CSV, so those of a changed CSV are never read back.
+
+A cache can be shared between threads. A result is computed outside the lock, so threads asking for the
+same missing result at once may each compute it, rather than waiting on each other.
+'''
+import os
+import pickle
+import hashlib
+import threading
+import collections
+
+from csv_cache import cached_content_hash
+
+DEFAULT_MAX_ENTRIES = 128
+
+
+class ResultCache(object):
+    def __init__(self, dataset_path, max_entries=DEFAULT_MAX_ENTRIES, cache_dir=None):
+        '''
+        Caches the results of analyses of the CSV at dataset_path, at most max_entries in memory. With a
+        cache_dir, results are also written there. A dataset_path of None is for data not read from a file,
+        which is never considered changed.
+        '''
+        self.dataset_path = dataset_path
+        self.max_entries = max_entries
+        self.cache_dir = None
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._dataset_hash = None
+        self._dataset_stat = self._stat()
+        self.set_cache_dir(cache_dir)
+
+    def set_cache_dir(self, cache_dir):
+        '''
+        Also keeps results in cache_dir from now on, or only in memory if None. Results already cached in
+        memory stay, along with the hit and miss counts, and are written to cache_dir too.
+        '''
+        if cache_dir is not None and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        with self._lock:
+            self.cache_dir = cache_dir
+            entries = list(self._entries.items())
+        for key, result in entries:
+            self._write(key, result)
+
+    def _stat(self):
+        if self.dataset_path is None:
+            return None
+        stat = os.stat(self.dataset_path)
+        return stat.st_size, stat.st_mtime
+
+    def dataset_changed(self):
+        '''
+        Whether the CSV has changed since the cache was created or last reset
+        '''
+        return self._stat() != self._dataset_stat
+
+    def reset(self):
+        '''
+        Drops every result held in memory and takes the current CSV as the dataset
+        '''
+        self._entries.clear()
+        self._dataset_hash = None
+        self._dataset_stat = self._stat()
+
+    def clear(self):
+        '''
+        Drops every result, including those written to the cache directory
+        '''
+        self.reset()
+        if self.cache_dir is not None:
+            for name in os.listdir(self.cache_dir):
+                if name.endswith(".pkl"):
+                    os.remove(os.path.join(self.cache_dir, name))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, compute):
+        '''
+        Returns the result cached for key, or compute() after caching it. Results are shared between
+        callers, so they shouldn't be changed.
+        '''
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+        result = self._read(key)
+        stored = result is not None
+        if not stored:
+            result = compute()
+            self._write(key, result)
+        with self._lock:
+            if stored:
+                self.hits += 1
+            else:
+                self.misses += 1
+            self._entries[key] = result
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return result
+
+    def _path(self, key):
+        if self._dataset_hash is None:
+            self._dataset_hash = cached_content_hash(self.dataset_path) if self.dataset_path is not None else ""
+        digest = hashlib.sha1("{0!s}{1!r}".format(self._dataset_hash, key).encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, digest + ".pkl")
+
+    def _read(self, key):
+        if self.cache_dir is None:
+            return None
+        try:
+            with open(self._path(key), "rb") as f:
+                stored_key, result = pickle.load(f)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError, ValueError):
+            return None
+        # guards against hash collisions and files from another version of the key
+        return result if stored_key == key else None
+
+    def _write(self, key, result):
+        if self.cache_dir is None:
+            return
+        path = self._path(key)
+        try:
+            with open(path + ".tmp", "wb") as f:
+                pickle.dump((key, result), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.rename(path + ".tmp", path)
+        except (IOError, OSError, pickle.PicklingError):
+            # a result that can't be stored is still cached in memory
+            pass
@@ -0,0 +1,290 @@
+'''
+Serves the analyses of one CSV as a JSON API on localhost, so dashboards and report jobs can query the
+numbers without each loading the CSV again.
+
+The CSV is loaded once when the server starts, each column the first time an endpoint uses it, and stays
+loaded. The analyzers of every script share that one load through an AnalysisSession. Requests are
+handled on a pool of threads, which share the loaded frame and the session's row indexes and cached
+results, all of which are only read once built. Responses are cached too, so a repeated query is answered
+without recomputing it. If the CSV changes, the analyzers reload it and every cached result and response
+is dropped. Plots aren't drawn, only the numbers are returned. With --mmap, the analyzers map the columns
+from their binary copy instead of loading them, sharing them with any other process analyzing the same CSV.
+
+i.e. python server.py ./compas-analysis/compas-scores-two-years.csv
+     python server.py scores.csv --columns race,sex,decile_score --port 8080 --workers 16
+     python server.py scores.csv --columns race,decile_score --mmap
+
+Endpoints, all GET, with their parameters:
+    /status
+    /trait_breakdown?col=race
+    /correct_for?col=race&dec=decile_score
+    /correct_for?col=race&dec=decile_score&trait=Caucasian&trait=Asian
+    /correct_for_rms?col=race,sex&dec=decile_score&trait=African-American/Male
+    /correct_for_non_uniform?col=race&dec=decile_score
+    /threshold_sweep?col=race&dec=decile_score&trait=ALL&thresholds=1,2,3.5
+    /threshold_sweep_all_traits?col=race&dec=decile_score
+    /fair_thresholds?col=race&dec=decile_score&constraint=fpr&tolerance=0.05
+    /score_models?col=race&dec=decile_score&models=linear,huber,log_loss:is_violent_recid
+    /score_models?col=race&dec=decile_score&models=huber(delta=2):is_violent_recid@8/2
+Leaving out trait, or giving ALL, uses every trait. Traits of several columns, i.e. col=race,sex, have
+their values separated by "/", and are returned as lists. Errors come back as {"error": message}, with
+status 400 for bad parameters and 404 for unknown endpoints.
+'''
+import os
+import sys
+import json
+import argparse
+import threading
+import contextlib
+import http.server
+import urllib.parse
+import concurrent.futures
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+import pandas as pd
+
+import plot_by_attr
+import plot_by_attr_non_uniform
+import plot_by_attr_threshold
+from result_cache import ResultCache
+from threshold_solver import DEFAULT_CONSTRAINT, DEFAULT_TOLERANCE
+from error_models import DEFAULT_MODELS
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_WORKERS = 8
+DEFAULT_THRESHOLDS = range(1, 10)
+
+
+class AnalysisService(object):
+    def __init__(self, filepath, columns=None, mmap=False):
+        '''
+        Loads filepath for plot_by_attr's analyses. The analyzers of the other scripts share its session, and
+        are made the first time one of their endpoints is asked for.
+        '''
+        self.filepath = filepath
+        self.columns = columns
+        self.mmap = mmap
+        self._analyzers = {}
+        self._lock = threading.Lock()
+        self.responses = ResultCache(filepath)
+        self.endpoints = {"trait_breakdown": self.trait_breakdown,
+                          "correct_for": self.correct_for,
+                          "correct_for_rms": lambda params: self.correct_for(params, rms=True),
+                          "correct_for_non_uniform": self.correct_for_non_uniform,
+                          "threshold_sweep": self.threshold_sweep,
+                          "threshold_sweep_all_traits": self.threshold_sweep_all_traits,
+                          "fair_thresholds": self.fair_thresholds,
+                          "score_models": self.score_models}
+        self.analyzer(plot_by_attr)
+
+    def analyzer(self, module):
+        '''
+        The DataAnalyzer of module, i.e. plot_by_attr_threshold, made on first use over the shared session
+        '''
+        with self._lock:
+            if module not in self._analyzers:
+                session = self._analyzers[plot_by_attr].session if plot_by_attr in self._analyzers else None
+                analyzer = module.DataAnalyzer(self.filepath, columns=self.columns, mmap=self.mmap, session=session)
+                # requests are handled off the main thread, where pyplot can't draw, and only want the numbers
+                analyzer._plot = lambda *args: None
+                self._analyzers[module] = analyzer
+            return self._analyzers[module]
+
+    def handle(self, endpoint, params):
+        '''
+        Returns the JSON ready result of endpoint for the query params, a dict of lists of values as from
+        urllib.parse.parse_qs. Results are cached until the CSV changes.
+        '''
+        if endpoint == "status":
+            return self.status()
+        if self.responses.dataset_changed():
+            self.responses.reset()
+        key = (endpoint, (), tuple(sorted((name, tuple(values)) for name, values in params.items())), None)
+        return self.responses.get(key, lambda: _to_json(self.endpoints[endpoint](params)))
+
+    def status(self):
+        analyzer = self.analyzer(plot_by_attr)
+        return {"dataset": self.filepath,
+                "rows": len(analyzer.df),
+                "columns": list(analyzer.df.columns),
+                "analyzers": sorted(module.__name__ for module in self._analyzers),
+                "cached_responses": len(self.responses),
+                "hits": self.responses.hits,
+                "misses": self.responses.misses}
+
+    def trait_breakdown(self, params):
+        col_name = _param(params, "col")
+        breakdown = self.analyzer(plot_by_attr).trait_breakdown(col_name)
+        return [{"trait": trait, "count": count} for trait, count in breakdown.items()]
+
+    def correct_for(self, params, rms=False):
+        col_name = _param(params, "col")
+        results = self.analyzer(plot_by_attr).correct_for(col_name, _param(params, "dec"),
+                                                          traits=_traits(params, col_name), rms=rms)
+        return _records(["baseline_error", "rms_error", "baseline_bias", "new_error", "new_rms_error"], results)
+
+    def correct_for_non_uniform(self, params):
+        col_name = _param(params, "col")
+        results = self.analyzer(plot_by_attr_non_uniform).correct_for(col_name, _param(params, "dec"),
+                                                                      traits=_traits(params, col_name))
+        return _records(["baseline_error", "baseline_bias", "new_error"], results)
+
+    def threshold_sweep(self, params):
+        threshold_res = self.analyzer(plot_by_attr_threshold).threshold_sweep(_param(params, "col"),
+                                                                              _param(params, "trait", "ALL"),
+                                                                              _param(params, "dec"),
+                                                                              thresholds=_thresholds(params))
+        return [dict(threshold_res[threshold], threshold=threshold) for threshold in threshold_res]
+
+    def threshold_sweep_all_traits(self, params):
+        threshold_frame, best_thresholds = self.analyzer(plot_by_attr_threshold).threshold_sweep_all_traits(
+            _param(params, "col"), _param(params, "dec"), thresholds=_thresholds(params))
+        return {"thresholds": threshold_frame.reset_index().to_dict("records"),
+                "best_thresholds": best_thresholds.reset_index().to_dict("records")}
+
+    def fair_thresholds(self, params):
+        fair_frame = self.analyzer(plot_by_attr_threshold).fair_thresholds(
+            _param(params, "col"), _param(params, "dec"), constraint=_param(params, "constraint", DEFAULT_CONSTRAINT),
+            tolerance=float(_param(params, "tolerance", DEFAULT_TOLERANCE)), thresholds=_thresholds(params))
+        return fair_frame.reset_index().to_dict("records")
+
+    def score_models(self, params):
+        col_name = _param(params, "col")
+        scores = self.analyzer(plot_by_attr).score_models(col_name, _param(params, "dec"), traits=_traits(params, col_name),
+                                                          models=_param(params, "models", DEFAULT_MODELS))
+        return scores.reset_index().to_dict("records")
+
+
+def _param(params, name, default=None):
+    if name in params:
+        return params[name][-1]
+    if default is None:
+        raise ValueError("Missing parameter {0!s}".format(name))
+    return default
+
+
+def _traits(params, col_name):
+    traits = params.get("trait", [])
+    if traits == [] or traits[0] == "ALL":
+        return []
+    if "," in col_name:
+        return [tuple(trait.split("/")) for trait in traits]
+    return traits
+
+
+def _thresholds(params):
+    if "thresholds" not in params:
+        return DEFAULT_THRESHOLDS
+    thresholds = [float(threshold) for threshold in _param(params, "thresholds").split(",")]
+    return [int(threshold) if threshold.is_integer() else threshold for threshold in thresholds]
+
+
+def _records(names, results):
+    '''
+    One record per trait from the per trait dicts correct_for returns
+    '''
+    return [dict([("trait", trait)] + [(name, result[trait]) for name, result in zip(names, results)])
+            for trait in results[0]]
+
+
+def _to_json(value):
+    # numpy scalars aren't JSON serializable, and nan isn't valid JSON
+    if isinstance(value, dict):
+        return dict(("{0!s}".format(_to_json(key)), _to_json(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return [_to_json(item) for item in value]
+    if isinstance(value, (float, np.floating)):
+        return None if np.isnan(value) else float(value)
+    if isinstance(value, (np.integer, np.bool_)):
+        return value.item()
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    return value
+
+
+class AnalysisRequestHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        endpoint = url.path.strip("/")
+        service = self.server.service
+        if endpoint != "status" and endpoint not in service.endpoints:
+            return self._reply(404, {"error": "Unknown endpoint {0!s}, use one of {1!s}".format(
+                endpoint, sorted(list(service.endpoints) + ["status"]))})
+        try:
+            self._reply(200, service.handle(endpoint, urllib.parse.parse_qs(url.query)))
+        except ValueError as e:
+            self._reply(400, {"error": "{0!s}".format(e)})
+        except KeyError as e:
+            self._reply(400, {"error": "Not found: {0!s}".format(e.args[0])})
+        except Exception as e:
+            self._reply(500, {"error": "{0!s}: {1!s}".format(type(e).__name__, e)})
+
+    def _reply(self, status, result):
+        body = json.dumps(result, allow_nan=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", "{0!s}".format(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class PooledHTTPServer(http.server.HTTPServer):
+    # connections waiting to be accepted, the default of 5 makes bursts of clients wait for a retry
+    request_queue_size = 128
+
+    def __init__(self, address, handler_class, service, workers=DEFAULT_WORKERS):
+        '''
+        HTTPServer answering requests on a pool of worker threads, instead of a new thread per request
+        '''
+        http.server.HTTPServer.__init__(self, address, handler_class)
+        self.service = service
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._process_request, request, client_address)
+
+    def _process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        http.server.HTTPServer.server_close(self)
+        self.pool.shutdown(wait=True)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Serve the analyses of a CSV as a JSON API on localhost")
+    parser.add_argument("filepath", help="CSV file to analyze")
+    parser.add_argument("--columns", default=None, help="comma separated columns to load up front, default only those the endpoints use, as they use them")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="address to listen on")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="threads to handle requests on")
+    parser.add_argument("--mmap", action="store_true", help="map the columns from their binary copy instead of loading them")
+    args = parser.parse_args(argv[1:])
+
+    columns = args.columns.split(",") if args.columns else None
+    with open(os.devnull, "w") as devnull:
+        with contextlib.redirect_stdout(devnull):
+            service = AnalysisService(os.path.normpath(args.filepath), columns=columns, mmap=args.mmap)
+        server = PooledHTTPServer((args.host, args.port), AnalysisRequestHandler, service, workers=args.workers)
+        print("Serving {0!s} on http://{1!s}:{2!s}".format(args.filepath, args.host, server.server_address[1]))
+        sys.stdout.flush()
+        # the analyzers print their results, which the requests get as JSON instead
+        with contextlib.redirect_stdout(devnull):
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
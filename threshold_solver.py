@@ -0,0 +1,94 @@
+'''
+Picks a threshold per group that minimizes the total error over all groups, subject to a fairness
+constraint, i.e. that every group's false positive rate is within some tolerance of every other's.
+
+The inputs are the false positive and negative curves of plot_by_attr_threshold, one row per group and
+one column per candidate threshold. A choice of thresholds meets the constraint when the constrained
+metric of every chosen point lies in a window [m, m + tolerance]. Sorting every (group, threshold)
+point by its metric, the window slides over them once with two pointers, while a monotonic deque per
+group keeps the lowest error point of that group inside the window. So the best window, and with it the
+best thresholds, is found in O(points log points) instead of trying every combination of thresholds.
+'''
+import collections
+import numpy as np
+
+CONSTRAINTS = ["none", "fpr", "fnr", "bias"]
+DEFAULT_CONSTRAINT = "fpr"
+DEFAULT_TOLERANCE = 0.02
+# rates are ratios of counts, so differences of exactly the tolerance can come out a little over it
+FLOAT_SLACK = 1e-12
+
+
+def constraint_metric(constraint, false_pos, false_neg, recid_totals, non_recid_totals):
+    '''
+    Returns the metric constrained to be equal across groups at every (group, threshold). A group without
+    anyone the rate is taken over, i.e. no one without recidivism for fpr, has nan rates.
+    '''
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if constraint == "fpr":
+            return false_pos / non_recid_totals[:, np.newaxis].astype(float)
+        if constraint == "fnr":
+            return false_neg / recid_totals[:, np.newaxis].astype(float)
+        if constraint == "bias":
+            return (false_pos - false_neg) / (recid_totals + non_recid_totals)[:, np.newaxis].astype(float)
+    raise ValueError("Unknown constraint {0!s}, use one of {1!s}".format(constraint, CONSTRAINTS))
+
+
+def solve_thresholds(errors, metric, tolerance):
+    '''
+    Returns the position of the chosen threshold of each group (row of errors), minimizing the total error
+    with the metric of every chosen point within tolerance of the others. Groups whose metric is nan
+    everywhere are left unconstrained. Ties go to the window with the lowest metric.
+    '''
+    choice = np.argmin(errors, axis=1)
+    constrained = ~np.isnan(metric).all(axis=1)
+    num_constrained = np.count_nonzero(constrained)
+    if num_constrained == 0:
+        return choice
+
+    groups, positions = np.nonzero(constrained[:, np.newaxis] & ~np.isnan(metric))
+    values = metric[groups, positions]
+    order = np.lexsort((positions, groups, values))
+    groups, positions, values = groups[order], positions[order], values[order]
+    point_errors = errors[groups, positions]
+
+    # indexes of the points of each group in the window, with increasing errors, so the first is its lowest
+    windows = [collections.deque() for _ in range(len(errors))]
+    covered = 0
+    total = 0
+    best_total = None
+    right = 0
+    for left in range(len(values)):
+        # widen the window to every point within tolerance of the left one
+        while right < len(values) and values[right] - values[left] <= tolerance + FLOAT_SLACK:
+            window = windows[groups[right]]
+            before = point_errors[window[0]] if window else None
+            while window and point_errors[window[-1]] > point_errors[right]:
+                window.pop()
+            window.append(right)
+            if before is None:
+                covered += 1
+                total += point_errors[window[0]]
+            else:
+                total += point_errors[window[0]] - before
+            right += 1
+
+        if covered == num_constrained and (best_total is None or total < best_total):
+            best_total = total
+            for window in windows:
+                if window:
+                    choice[groups[window[0]]] = positions[window[0]]
+
+        # then drop the left point before the window moves on
+        window = windows[groups[left]]
+        if window and window[0] == left:
+            window.popleft()
+            if window:
+                total += point_errors[window[0]] - point_errors[left]
+            else:
+                covered -= 1
+                total -= point_errors[left]
+
+    if best_total is None:
+        raise ValueError("No thresholds keep every group within {0!s} of each other".format(tolerance))
+    return choice